@@ -0,0 +1,161 @@
+"""
+Headless Batch Plot Renderer
+
+    Use_headless_backend():
+        Switch matplotlib to the non-interactive Agg backend
+    Parse_spec():
+        Turn one spec line into a plot spec dictionary
+    Read_spec_file():
+        Read every plot spec from a file, one per line
+    Spec_file_name():
+        Build the output file name for a plot spec
+    Load_data():
+        Load a dataset once per worker process, through the cache
+    Render_spec():
+        Render one plot spec to its own file
+    Render_batch():
+        Render a list of plot specs across a process pool
+
+    Main():
+        Read specs, render them, print the files written
+
+Spec lines, blank lines and # comments are skipped:
+    year 2019                       cumulative percent plot for a year
+    region Far West GDPp PIp        region scatter with regression line
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+
+def use_headless_backend():
+    """Switch matplotlib to the non-interactive Agg backend"""
+
+    matplotlib.use("Agg")
+
+
+# Backend must be chosen before the graphers import pylab
+use_headless_backend()
+
+import financialGrapher  # noqa: E402
+import regionGrapher  # noqa: E402
+
+# Loaded datasets, one copy per worker process
+DATA_DICT = {}
+
+
+def parse_spec(line):
+    """Turn one spec line into a plot spec dictionary"""
+
+    word_list = line.split()
+
+    # year <year>
+    if word_list[0] == "year" and len(word_list) == 2:
+        return {"kind": "year", "year": int(word_list[1])}
+
+    # region <region name, may contain spaces> <x> <y>
+    if word_list[0] == "region" and len(word_list) >= 4:
+        return {"kind": "region", "region": " ".join(word_list[1:-2]),
+                "x": word_list[-2], "y": word_list[-1]}
+
+    raise ValueError("Bad plot spec: " + line.strip())
+
+
+def read_spec_file(fp):
+    """Read every plot spec from a file, one per line"""
+
+    return [parse_spec(line) for line in fp
+            if line.strip() != "" and not line.strip().startswith("#")]
+
+
+def spec_file_name(spec, out_dir=".", fmt="png"):
+    """Build the output file name for a plot spec"""
+
+    if "file" in spec:
+        return spec["file"]
+
+    if spec["kind"] == "year":
+        name = "year{}".format(spec["year"])
+    else:
+        name = "region_{}_{}_{}".format(spec["region"].replace(" ", "_"),
+                                        spec["x"], spec["y"])
+
+    return os.path.join(out_dir, name + "." + fmt)
+
+
+def load_data(kind, data_dir, key=None):
+    """Load a dataset once per worker process, through the cache"""
+
+    if (kind, data_dir, key) in DATA_DICT:
+        return DATA_DICT[(kind, data_dir, key)]
+
+    if kind == "year":
+        data = financialGrapher.read_year_file(
+            os.path.join(data_dir, "year{}.txt".format(key)))
+    else:
+        data = regionGrapher.load_state_table(data_dir)
+
+    DATA_DICT[(kind, data_dir, key)] = data
+    return data
+
+
+def render_spec(spec, out_dir=".", data_dir=".", fmt="png"):
+    """Render one plot spec to its own file"""
+
+    file_str = spec_file_name(spec, out_dir, fmt)
+
+    if spec["kind"] == "year":
+        master_list = load_data("year", data_dir, spec["year"])
+        range_list, percentage_list = financialGrapher.plot_values(
+            master_list)
+        financialGrapher.do_plot(range_list, percentage_list, spec["year"],
+                                 file_str, show=False)
+    else:
+        state_table = load_data("region", data_dir)
+        if spec["region"] not in regionGrapher.REGION_LIST:
+            raise ValueError("Unknown region: " + spec["region"])
+        state_list = regionGrapher.region_summary(state_table,
+                                                  spec["region"])["states"]
+        regionGrapher.plot(state_list, spec["x"], spec["y"], file_str,
+                           show=False)
+
+    return file_str
+
+
+def render_batch(spec_list, out_dir=".", data_dir=".", workers=None,
+                 fmt="png"):
+    """Render a list of plot specs across a process pool"""
+
+    os.makedirs(out_dir, exist_ok=True)
+    n = len(spec_list)
+
+    # Return output file names in spec order
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=use_headless_backend) as pool:
+        return list(pool.map(render_spec, spec_list, [out_dir]*n,
+                             [data_dir]*n, [fmt]*n))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Render plots headless")
+    parser.add_argument("spec_file", help="file of plot specs, one per line")
+    parser.add_argument("--out-dir", default="plots")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--format", default="png")
+    args = parser.parse_args()
+
+    with open(args.spec_file, "r") as fp:
+        spec_list = read_spec_file(fp)
+
+    for file_str in render_batch(spec_list, args.out_dir, args.data_dir,
+                                 args.workers, args.format):
+        print(file_str)
+
+
+if __name__ == '__main__':
+    main()
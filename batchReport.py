@@ -0,0 +1,247 @@
+"""
+Batch Report Generator
+
+    Report_specs():
+        List every section of the full report, in report order
+    Load_data():
+        Load the county table, state table and join once per process
+    County_text():
+        Format county rows the way the financialSorter menu prints them
+    State_text():
+        Format state averages the way the financialSorter menu prints them
+    Region_section():
+        One region's summary, state rows and county aggregates
+    State_section():
+        One state's counties in alphabetical order
+    National_section():
+        National top or bottom counties or states
+    Render_section():
+        Build the rows and text of one report section
+    Render_report():
+        Render every section across a process pool
+    Write_report():
+        Write report.txt, report.json and one CSV file per section
+
+    Main():
+        Load the data once, render the report, print the files written
+
+Each section is a dictionary with its name, title, column names, rows and
+formatted text. Sections only read the data, so they render in any order
+and the output keeps report order.
+"""
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import countyJoin
+import financialSorter
+import regionGrapher
+
+# Constants
+NATIONAL_QUERIES = ["top_counties", "bottom_counties", "top_states",
+                    "bottom_states"]
+REGION_COLUMNS = ["State", "Population(m)", "GDP(m)", "Income(m)",
+                  "GDP per capita", "Income per capita"]
+
+# Loaded data, one copy per worker process
+DATA_DICT = {}
+
+
+def report_specs(n=10):
+    """List every section of the full report, in report order"""
+
+    spec_list = [{"kind": "region", "key": region}
+                 for region in regionGrapher.REGION_LIST]
+    spec_list += [{"kind": "state", "key": state}
+                  for state in financialSorter.STATES]
+    spec_list += [{"kind": "national", "key": query, "n": n}
+                  for query in NATIONAL_QUERIES]
+
+    return spec_list
+
+
+def load_data(data_dir):
+    """Load the county table, state table and join once per process"""
+
+    if data_dir not in DATA_DICT:
+        DATA_DICT[data_dir] = countyJoin.load_joined(data_dir)
+
+    return DATA_DICT[data_dir]
+
+
+def county_text(title, display_list):
+    """Format county rows the way the financialSorter menu prints them"""
+
+    line_list = ["\n" + title,
+                 "{:<10}{:<30s}{:10s}".format("State", "County",
+                                              "Median Household Income")]
+    for e in display_list:
+        line_list.append("{:<10}{:<30s}${:<10,d}".format(e[0], e[1], e[2]))
+
+    return "\n".join(line_list)
+
+
+def state_text(title, display_list):
+    """Format state averages the way the financialSorter menu prints them"""
+
+    line_list = ["\n" + title,
+                 "{:<10}{:<10s}".format("State", "Median Household Income")]
+    for e in display_list:
+        line_list.append("{:<10}${:<10,.2f}".format(e[0], e[1]))
+
+    return "\n".join(line_list)
+
+
+def region_section(county_table, state_table, joined, region):
+    """One region's summary, state rows and county aggregates"""
+
+    summary = regionGrapher.region_summary(state_table, region)
+    text = regionGrapher.format_region(state_table, region)
+
+    # County incomes inside the region, from the county join
+    rows = countyJoin.region_counties(county_table, joined, region)
+    if rows is not None and len(rows) > 0:
+        income = county_table["income"][rows]
+        text += ("\n\n{:,d} counties, median household income ${:,d} to "
+                 "${:,d}, middle county ${:,.0f}".format(
+                     len(rows), int(income[-1]), int(income[0]),
+                     (income[(len(rows) - 1)//2] + income[len(rows)//2])/2))
+
+    return {"title": "Data for the {:s} region".format(region),
+            "columns": REGION_COLUMNS,
+            "rows": [list(state) for state in summary["states"]],
+            "text": text}
+
+
+def state_section(county_table, state):
+    """One state's counties in alphabetical order"""
+
+    display_list = financialSorter.counties_in_state(state, county_table)
+
+    # Same header as menu option 6
+    if len(display_list) > 0:
+        line_list = ["\nThere are {} counties in {}:".format(
+            len(display_list), state),
+            "{:<30s}{:<10}".format("County", "Median Household Income")]
+    else:
+        line_list = ["\nThere are 0 counties in {}".format(state)]
+    for e in display_list:
+        line_list.append("{:<30s}${:<10,d}".format(e[0], e[1]))
+
+    return {"title": "Counties in {}".format(state),
+            "columns": ["County", "Median Household Income"],
+            "rows": [list(e) for e in display_list],
+            "text": "\n".join(line_list)}
+
+
+def national_section(county_table, query, n):
+    """National top or bottom counties or states"""
+
+    display_list = financialSorter.run_query("{} {}".format(query, n),
+                                             county_table)
+    rank = "Top" if query.startswith("top") else "Bottom"
+
+    if query.endswith("counties"):
+        title = "{} {} Counties by Median Household Income (2018)".format(
+            rank, n)
+        columns = ["State", "County", "Median Household Income"]
+        text = county_text(title, display_list)
+    else:
+        title = "{} {} States by Average Median Household Income (2018)" \
+            .format(rank, n)
+        columns = ["State", "Median Household Income"]
+        text = state_text(title, display_list)
+
+    return {"title": title, "columns": columns,
+            "rows": [list(e) for e in display_list], "text": text}
+
+
+def render_section(spec, data_dir="."):
+    """Build the rows and text of one report section"""
+
+    county_table, state_table, joined = load_data(data_dir)
+
+    if spec["kind"] == "region":
+        section = region_section(county_table, state_table, joined,
+                                 spec["key"])
+    elif spec["kind"] == "state":
+        section = state_section(county_table, spec["key"])
+    else:
+        section = national_section(county_table, spec["key"], spec["n"])
+
+    section["name"] = "{}_{}".format(spec["kind"],
+                                     spec["key"].replace(" ", "_"))
+    return section
+
+
+def render_report(spec_list, data_dir=".", workers=None):
+    """Render every section across a process pool"""
+
+    n = len(spec_list)
+
+    # Sections are small, hand them out a few at a time
+    chunk = max(1, n//(4*(workers or os.cpu_count() or 1)))
+
+    # Sections come back in spec order
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_section, spec_list, [data_dir]*n,
+                             chunksize=chunk))
+
+
+def write_report(section_list, out_dir="report"):
+    """Write report.txt, report.json and one CSV file per section"""
+
+    os.makedirs(os.path.join(out_dir, "csv"), exist_ok=True)
+    file_list = []
+
+    # Formatted text, sections in report order
+    file_str = os.path.join(out_dir, "report.txt")
+    with open(file_str, "w") as fp:
+        for section in section_list:
+            fp.write(section["text"] + "\n")
+    file_list.append(file_str)
+
+    # Every section's rows in one JSON document
+    file_str = os.path.join(out_dir, "report.json")
+    with open(file_str, "w") as fp:
+        json.dump([{k: section[k] for k in ("name", "title", "columns",
+                                            "rows")}
+                   for section in section_list], fp, indent=1)
+    file_list.append(file_str)
+
+    # One CSV per section, header row first
+    for section in section_list:
+        file_str = os.path.join(out_dir, "csv", section["name"] + ".csv")
+        with open(file_str, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(section["columns"])
+            writer.writerows(section["rows"])
+        file_list.append(file_str)
+
+    return file_list
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Write the full report")
+    parser.add_argument("--out-dir", default="report")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=10,
+                        help="rows in the national top/bottom tables")
+    args = parser.parse_args(argv)
+
+    # Load once here, workers reuse the copy or the disk cache
+    load_data(args.data_dir)
+
+    section_list = render_report(report_specs(args.top), args.data_dir,
+                                 args.workers)
+    for file_str in write_report(section_list, args.out_dir):
+        print(file_str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Parallel Reader Check
+
+    Write_tricky_csv():
+        Copy a county CSV, giving some counties quoted newlines and quotes
+    Same_table():
+        List the columns where two county tables differ
+    Check_parallel_read():
+        Compare read_file_parallel against read_file for many worker counts
+
+    Main():
+        Build the tricky file, run the check, exit 1 on any difference
+
+Chunk boundaries in read_file_parallel are found by counting quotes, so
+quoted newlines and "" escapes are the cases that could split a record.
+"""
+
+import argparse
+import csv
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import financialSorter
+
+
+def write_tricky_csv(in_str, out_str, every=3):
+    """Copy a county CSV, giving some counties quoted newlines and quotes"""
+
+    with open(in_str, "r", newline="") as in_fp, \
+            open(out_str, "w", newline="") as out_fp:
+        out_fp.write(in_fp.readline())
+        writer = csv.writer(out_fp)
+
+        for i, line_list in enumerate(csv.reader(in_fp)):
+            # "Name County, ST" -> "Name ""Old""\nCounty, ST", still one cell
+            if i % every == 0 and "," in line_list[1]:
+                county, state = line_list[1].rsplit(",", 1)
+                line_list[1] = '{} "Old"\n{}\r\n,{}'.format(
+                    county, "County" if i % 2 else "", state)
+            writer.writerow(line_list)
+
+
+def same_table(table_a, table_b):
+    """List the columns where two county tables differ"""
+
+    diff_list = []
+    for name in sorted(set(table_a) | set(table_b)):
+        a, b = table_a.get(name), table_b.get(name)
+        if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+            equal = np.array_equal(a, b)
+        else:
+            equal = a == b
+        if not equal:
+            diff_list.append(name)
+
+    return diff_list
+
+
+def check_parallel_read(file_str, worker_list=range(1, 17)):
+    """Compare read_file_parallel against read_file for many worker counts"""
+
+    with open(file_str, "r", newline="") as fp:
+        serial = financialSorter.read_file(fp)
+
+    # Worker count -> differing columns, empty when the tables match. A
+    # record split mid-way usually fails to parse at all
+    result = {}
+    for workers in worker_list:
+        try:
+            result[workers] = same_table(
+                serial, financialSorter.read_file_parallel(file_str, workers))
+        except (ValueError, IndexError) as err:
+            result[workers] = ["read failed: {!r}".format(err)]
+
+    return result
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Check the parallel reader")
+    parser.add_argument("data_file", nargs="?", default="data.csv")
+    parser.add_argument("--max-workers", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_str = os.path.join(tmp_dir, "tricky.csv")
+        write_tricky_csv(args.data_file, file_str)
+        result = check_parallel_read(file_str,
+                                     range(1, args.max_workers + 1))
+
+    failed = False
+    for workers, diff_list in result.items():
+        if len(diff_list) > 0:
+            failed = True
+            print("{} workers: differs in {}".format(
+                workers, ", ".join(diff_list)))
+
+    print("FAILED" if failed else "ok, {} worker counts match".format(
+        len(result)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
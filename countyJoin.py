@@ -0,0 +1,171 @@
+"""
+County To State Join
+
+    State_lookup():
+        Dense table from state ID to state table row, -1 where missing
+    Region_codes():
+        Region names of a state table and the region code of every row
+    Join_counties():
+        Attach state GDP per capita, population and region to every county
+    Refresh_state_columns():
+        Recopy changed state columns onto the counties of an existing join
+    Region_county_stats():
+        Group county incomes by region: count, sum, mean, min, max, median
+    Region_order():
+        County rows grouped by region, decreasing income in each
+    Region_counties():
+        Find a region's county rows in decreasing income order
+    Load_joined():
+        Load the county and state tables from a directory and join them
+
+Counties from financialSorter and states from regionGrapher meet on the
+shared IDs in stateIds, so the join is one array lookup per county. Joined
+columns line up with the county table's rows. Counties whose state has no
+row in the state table keep -1 codes and nan values.
+"""
+
+import numpy as np
+
+import financialSorter
+import regionGrapher
+import stateIds
+
+# Constants, state table columns copied onto every county
+STATE_COLUMNS = ["gdp_pc", "income_pc", "pop"]
+
+
+def state_lookup(state_table):
+    """Dense table from state ID to state table row, -1 where missing"""
+
+    lookup = np.full(len(stateIds.STATE_LIST), -1, dtype=np.int64)
+    ids = state_table["state_id"]
+    known = ids >= 0
+    lookup[ids[known]] = np.flatnonzero(known)
+
+    return lookup
+
+
+def region_codes(state_table):
+    """Region names of a state table and the region code of every row"""
+
+    # Regions in REGION_LIST order, "all" is not a region of its own
+    region_names = [region for region in regionGrapher.REGION_LIST
+                    if region != "all" and
+                    region in state_table["region_index"]]
+    code_dict = {region: code for code, region in enumerate(region_names)}
+
+    codes = np.array([code_dict.get(region, -1)
+                      for region in state_table["region"]], dtype=np.int64)
+    return region_names, codes
+
+
+def join_counties(county_table, state_table):
+    """Attach state GDP per capita, population and region to every county"""
+
+    # County state codes are state IDs, codes past the ID list are unknown
+    lookup = state_lookup(state_table)
+    codes = county_table["state"].astype(np.int64)
+    known = codes < len(lookup)
+    state_row = np.full(len(codes), -1, dtype=np.int64)
+    state_row[known] = lookup[codes[known]]
+    matched = state_row >= 0
+
+    joined = {"state_row": state_row, "matched": matched}
+
+    refresh_state_columns(joined, county_table, state_table, STATE_COLUMNS)
+
+    # Region code per county, -1 for unmatched counties
+    region_names, state_region = region_codes(state_table)
+    joined["region_names"] = region_names
+    joined["region"] = np.full(len(codes), -1, dtype=np.int64)
+    joined["region"][matched] = state_region[state_row[matched]]
+
+    return joined
+
+
+def refresh_state_columns(joined, county_table, state_table, column_list):
+    """Recopy changed state columns onto the counties of an existing join"""
+
+    state_row = joined["state_row"]
+    matched = joined["matched"]
+
+    # State columns as floats so unmatched counties can hold nan
+    for column in column_list:
+        if column in STATE_COLUMNS:
+            values = np.full(len(state_row), np.nan)
+            values[matched] = state_table[column][state_row[matched]]
+            joined[column] = values
+
+    # County income against its state's output per person
+    if "gdp_pc" in column_list:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            joined["income_to_gdp_pc"] = \
+                county_table["income"]/joined["gdp_pc"]
+
+        # Region stats average gdp_pc, recompute them on next use
+        joined.pop("region_stats", None)
+
+
+def region_county_stats(county_table, joined):
+    """Group county incomes by region: count, sum, mean, min, max, median"""
+
+    # Computed once per join, later calls reuse the cached result
+    if "region_stats" in joined:
+        return joined["region_stats"]
+
+    # County rows are in decreasing income order, a stable sort by region
+    # keeps each group contiguous and still decreasing
+    order = region_order(joined)
+    n_regions = len(joined["region_names"])
+    offsets = financialSorter.group_offsets(joined["region"][order],
+                                            n_regions)
+    stats = financialSorter.group_stats(county_table["income"][order],
+                                        offsets)
+
+    # County-weighted average of the states' GDP per capita
+    stats["mean_gdp_pc"] = np.full(n_regions, np.nan)
+    group = np.flatnonzero(stats["count"])
+    if len(group) > 0:
+        stats["mean_gdp_pc"][group] = np.add.reduceat(
+            joined["gdp_pc"][order], offsets[group])/stats["count"][group]
+
+    joined["region_offsets"] = offsets
+    joined["region_stats"] = stats
+    return stats
+
+
+def region_order(joined):
+    """County rows grouped by region, decreasing income in each"""
+
+    if "by_region" not in joined:
+        rows = np.flatnonzero(joined["region"] >= 0)
+        joined["by_region"] = rows[np.argsort(joined["region"][rows],
+                                              kind="stable")]
+
+    return joined["by_region"]
+
+
+def region_counties(county_table, joined, region):
+    """Find a region's county rows in decreasing income order"""
+
+    # Whole country, every county with a region
+    if region == "all":
+        return np.flatnonzero(joined["region"] >= 0)
+
+    if region not in joined["region_names"]:
+        return None
+
+    region_county_stats(county_table, joined)
+    code = joined["region_names"].index(region)
+    offsets = joined["region_offsets"]
+    return region_order(joined)[offsets[code]:offsets[code + 1]]
+
+
+def load_joined(directory="."):
+    """Load the county and state tables from a directory and join them"""
+
+    county_table = financialSorter.load_county_table(directory)
+    state_table = regionGrapher.load_state_table(directory)
+
+    return county_table, state_table, join_counties(county_table,
+                                                    state_table)
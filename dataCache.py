@@ -0,0 +1,138 @@
+"""
+Parsed Data Cache
+
+    File_fingerprint():
+        Get path, size, mtime and content hash for a source file
+    Fingerprint_matches():
+        Check a stored fingerprint against the file on disk
+    Cache_path():
+        Build the cache file name for a reader and its source files
+    Load_cached():
+        Return cached parsed data for source files, rebuild if stale
+    Cached_read():
+        Run reader(fp) through the cache, keyed on fp's file
+    Write_entry():
+        Write header and data atomically, ignore unwritable cache dirs
+
+Cache files hold two pickles back to back: a small header with the source
+fingerprints, then the parsed data. A stale header means the data pickle
+is never unpickled. Bump CACHE_VERSION when a reader's output changes.
+"""
+
+import hashlib
+import os
+import pickle
+
+# Constants
+CACHE_VERSION = 5
+CACHE_DIR = os.environ.get("INCOME_CACHE_DIR", ".income_cache")
+HASH_BLOCK = 1 << 20
+
+
+def file_fingerprint(path):
+    """Get path, size, mtime and content hash for a source file"""
+
+    stat = os.stat(path)
+
+    # Hash the contents in blocks to keep memory bounded
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK), b""):
+            digest.update(block)
+
+    return {"path": os.path.abspath(path), "size": stat.st_size,
+            "mtime": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+
+
+def fingerprint_matches(stored):
+    """Check a stored fingerprint against the file on disk"""
+
+    try:
+        stat = os.stat(stored["path"])
+    except OSError:
+        return False
+
+    # Size and mtime unchanged, trust the entry without rehashing
+    if stat.st_size == stored["size"] and stat.st_mtime_ns == stored["mtime"]:
+        return True
+
+    # Touched but maybe not changed, fall back to the content hash
+    if stat.st_size != stored["size"]:
+        return False
+    current = file_fingerprint(stored["path"])
+    if current["sha256"] != stored["sha256"]:
+        return False
+
+    # Same contents, remember the new mtime so the next check is cheap
+    stored["mtime"] = current["mtime"]
+    return True
+
+
+def cache_path(name, paths, cache_dir=None):
+    """Build the cache file name for a reader and its source files"""
+
+    key = "\0".join([name] + [os.path.abspath(p) for p in paths])
+    digest = hashlib.sha256(key.encode("utf8")).hexdigest()[:24]
+
+    return os.path.join(cache_dir or CACHE_DIR, name + "-" + digest + ".pkl")
+
+
+def load_cached(name, paths, build, cache_dir=None):
+    """Return cached parsed data for source files, rebuild if stale"""
+
+    file_str = cache_path(name, paths, cache_dir)
+
+    # Try the existing entry, header first
+    try:
+        with open(file_str, "rb") as fp:
+            header = pickle.load(fp)
+            sources = header["sources"]
+            old_mtimes = [s["mtime"] for s in sources]
+            fresh = header["version"] == CACHE_VERSION and \
+                len(sources) == len(paths) and \
+                all(fingerprint_matches(s) for s in sources)
+            data = pickle.load(fp) if fresh else None
+
+        if fresh:
+            # Store refreshed mtimes so the next launch skips hashing
+            if old_mtimes != [s["mtime"] for s in sources]:
+                write_entry(file_str, header, data)
+            return data
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        pass
+
+    # Missing or stale, fingerprint sources before parsing them
+    header = {"version": CACHE_VERSION,
+              "sources": [file_fingerprint(p) for p in paths]}
+    data = build()
+    write_entry(file_str, header, data)
+
+    return data
+
+
+def cached_read(fp, reader, name=None, cache_dir=None):
+    """Run reader(fp) through the cache, keyed on fp's file"""
+
+    name = name or reader.__name__
+
+    def build():
+        return reader(fp)
+
+    try:
+        return load_cached(name, [fp.name], build, cache_dir)
+    finally:
+        fp.close()
+
+
+def write_entry(file_str, header, data):
+    """Write header and data atomically, ignore unwritable cache dirs"""
+
+    try:
+        os.makedirs(os.path.dirname(file_str), exist_ok=True)
+        tmp_str = file_str + ".tmp" + str(os.getpid())
+        with open(tmp_str, "wb") as fp:
+            pickle.dump(header, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_str, file_str)
+    except OSError:
+        pass
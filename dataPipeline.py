@@ -0,0 +1,213 @@
+"""
+Incremental Data Pipeline
+
+    New_pipeline():
+        Build every table once from the four files in a directory
+    Changed_sources():
+        Find the source files whose contents changed since they were parsed
+    Parse_source():
+        Parse one source file on its own, for pool workers
+    Reparse():
+        Fingerprint and parse a list of sources concurrently
+    Rebuild_state_table():
+        Join the three state sources into a fresh state table
+    Update_state_table():
+        Replace changed sources' columns in place, None if rows changed
+    Refresh():
+        Reparse changed sources, recompute only what depends on them
+    Watch():
+        Poll the source files, refresh whenever one of them changes
+
+    Main():
+        Build the pipeline, print each refresh until interrupted
+
+Dependencies, each step reruns only when something above it changed:
+    data.csv -> county table -----------------------> join
+    income.csv -> income, income_pc --+
+    gdp.csv -> gdp, gdp_pc -----------+-> state table -> join columns
+    pop.csv -> pop, income_pc, gdp_pc -+               region summaries
+A state source that adds, drops or moves a state rebuilds the state table
+and the join instead of updating columns.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import countyJoin
+import dataCache
+import financialSorter
+import regionGrapher
+
+# Constants
+SOURCE_FILES = {"county": "data.csv", "income": "income.csv",
+                "gdp": "gdp.csv", "pop": "pop.csv"}
+STATE_SOURCES = ["income", "gdp", "pop"]
+
+
+def new_pipeline(directory="."):
+    """Build every table once from the four files in a directory"""
+
+    pipeline = {"directory": directory,
+                "paths": {kind: os.path.join(directory, file_str)
+                          for kind, file_str in SOURCE_FILES.items()},
+                "fingerprints": {}, "parsed": {}, "county_table": None,
+                "state_table": None, "joined": None}
+    refresh(pipeline)
+
+    return pipeline
+
+
+def changed_sources(pipeline):
+    """Find the source files whose contents changed since they were parsed"""
+
+    fingerprints = pipeline["fingerprints"]
+
+    # Size and mtime first, content hash only when a file was touched
+    return [kind for kind in SOURCE_FILES
+            if kind not in fingerprints or
+            not dataCache.fingerprint_matches(fingerprints[kind])]
+
+
+def parse_source(kind, file_str):
+    """Parse one source file on its own, for pool workers"""
+
+    if kind == "county":
+        with open(file_str, "r") as fp:
+            return financialSorter.read_file(fp)
+
+    return regionGrapher.parse_file(kind, file_str)
+
+
+def reparse(pipeline, kind_list):
+    """Fingerprint and parse a list of sources concurrently"""
+
+    # Fingerprint before parsing, a write during the parse shows up as a
+    # change on the next refresh
+    paths = pipeline["paths"]
+    for kind in kind_list:
+        pipeline["fingerprints"][kind] = dataCache.file_fingerprint(
+            paths[kind])
+
+    with ThreadPoolExecutor(max_workers=len(kind_list)) as pool:
+        job_dict = {kind: pool.submit(parse_source, kind, paths[kind])
+                    for kind in kind_list}
+        for kind, job in job_dict.items():
+            pipeline["parsed"][kind] = job.result()
+
+
+def rebuild_state_table(pipeline):
+    """Join the three state sources into a fresh state table"""
+
+    parsed = pipeline["parsed"]
+    master_dict, missing = regionGrapher.join_state_data(
+        parsed["income"], parsed["gdp"], parsed["pop"])
+
+    state_table = regionGrapher.build_state_table(master_dict)
+    state_table["missing"] = missing
+    pipeline["state_table"] = state_table
+
+
+def update_state_table(pipeline, kind_list):
+    """Replace changed sources' columns in place, None if rows changed"""
+
+    state_table = pipeline["state_table"]
+    if state_table is None:
+        return None
+
+    # The same states must still be complete in all three sources
+    parsed = pipeline["parsed"]
+    master_dict, missing = regionGrapher.join_state_data(
+        parsed["income"], parsed["gdp"], parsed["pop"])
+    if set(master_dict) != set(state_table["name"]):
+        return None
+
+    column_list = []
+    for kind in kind_list:
+        columns = regionGrapher.update_state_columns(state_table, kind,
+                                                     parsed[kind])
+        if columns is None:
+            return None
+        column_list += [c for c in columns if c not in column_list]
+
+    state_table["missing"] = missing
+    return column_list
+
+
+def refresh(pipeline):
+    """Reparse changed sources, recompute only what depends on them"""
+
+    changed = changed_sources(pipeline)
+    if len(changed) == 0:
+        return []
+
+    # Parse only the files that changed
+    reparse(pipeline, changed)
+    step_list = ["parse " + kind for kind in changed]
+    if "county" in changed:
+        pipeline["county_table"] = pipeline["parsed"].pop("county")
+
+    # State table, column updates when the rows stay the same
+    column_list = []
+    rebuilt = False
+    state_changed = [kind for kind in STATE_SOURCES if kind in changed]
+    if len(state_changed) > 0:
+        column_list = update_state_table(pipeline, state_changed)
+        if column_list is None:
+            rebuild_state_table(pipeline)
+            rebuilt = True
+            step_list.append("build state table")
+        else:
+            step_list.append("update " + ", ".join(column_list))
+
+    # Join, recopy only the state columns that changed
+    if "county" in changed or rebuilt:
+        pipeline["joined"] = countyJoin.join_counties(
+            pipeline["county_table"], pipeline["state_table"])
+        step_list.append("join counties")
+    elif len(column_list) > 0:
+        countyJoin.refresh_state_columns(
+            pipeline["joined"], pipeline["county_table"],
+            pipeline["state_table"], column_list)
+        step_list.append("refresh joined " + ", ".join(
+            [c for c in column_list if c in countyJoin.STATE_COLUMNS]))
+
+    return step_list
+
+
+def watch(pipeline, interval=1.0, on_change=None, max_polls=None):
+    """Poll the source files, refresh whenever one of them changes"""
+
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        time.sleep(interval)
+        polls += 1
+
+        step_list = refresh(pipeline)
+        if len(step_list) > 0 and on_change is not None:
+            on_change(pipeline, step_list)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Watch the data files")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between checks of the files")
+    args = parser.parse_args()
+
+    def report(pipeline, step_list):
+        print(time.strftime("%H:%M:%S"), "; ".join(step_list))
+
+    pipeline = new_pipeline(args.data_dir)
+    print("Loaded", ", ".join(pipeline["paths"].values()))
+
+    try:
+        watch(pipeline, args.interval, report)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
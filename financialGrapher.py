@@ -3,6 +3,8 @@ Income Data Analysis
 
     Do_plot():
         Plot income range vs. percent of population
+    Plot_values():
+        Gather lower bracket bounds and cumulative percents to plot
     Open_file():
         Opens file for reading, prompts until successful
     Handle_commas():
@@ -20,6 +22,34 @@ Income Data Analysis
     Get_percent():
         Finds income bracket containing given salary
 
+    Build_distribution():
+        Build bracket boundary and cumulative percent arrays once
+    Bracket_index():
+        Count bracket edges below each value, one row per year
+    Percentile_of():
+        Cumulative percent of population at each salary, vectorized
+    Income_at():
+        Income at each cumulative percent of population, vectorized
+
+    Find_year_files():
+        Find every yearXXXX.txt file in a directory, keyed by year
+    Read_year_file():
+        Open and read one year file through the parsed-data cache
+    Load_years():
+        Read every year file in a directory concurrently
+    Build_cube():
+        Stack each year's brackets into year x bracket arrays
+    Cube_average():
+        Average salary for every year at once
+    Cube_median():
+        Median for every year at once
+    Cube_bracket():
+        One bracket of a cube row as ((low, high), percent, average)
+    Cube_range():
+        Get_range() on one year of a cube
+    Cube_percent():
+        Get_percent() on one year of a cube
+
     Main():
         Basic prompts and data displays
         Input loop prompting r for range, p for percent, "" for quit
@@ -31,12 +61,36 @@ Income Data Analysis
                 Get cumulative percentage, income range
 """
 
+import bisect
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+import matplotlib
+import numpy as np
 import pylab
 
+import dataCache
+import numParse
+import plotCache
+
 
-def do_plot(x_vals, y_vals, year):
+def do_plot(x_vals, y_vals, year, file_str="plot.png", show=True):
     '''Plot x_vals vs. y_vals, each is list of numbers of same length.'''
 
+    # Headless plots with unchanged inputs reuse the cached render
+    key = plotCache.plot_key(
+        [x_vals, y_vals], ['Income', 'Cumulative Percent', year],
+        {"kind": "year", "figsize": [6.4, 4.8], "dpi": 100,
+         "matplotlib": matplotlib.__version__}, file_str.rsplit(".", 1)[-1])
+    if not show and plotCache.fetch(key, file_str):
+        return
+
+    # Fresh figure so repeated plots do not draw over each other
+    pylab.rcParams['figure.figsize'] = 6.4, 4.8
+    pylab.figure()
+
     # Titles/labels
     pylab.xlabel('Income')
     pylab.ylabel('Cumulative Percent')
@@ -44,11 +98,23 @@ def do_plot(x_vals, y_vals, year):
 
     # Make plot
     pylab.plot(x_vals, y_vals)
-    pylab.rcParams['figure.figsize'] = 6.4, 4.8
 
-    # Save and display
-    pylab.savefig("plot.png", dpi=100)
-    pylab.show()
+    # Save and display, headless callers skip the window
+    pylab.savefig(file_str, dpi=100)
+    plotCache.store(key, file_str)
+    if show:
+        pylab.show()
+    pylab.close()
+
+
+def plot_values(master_list, n_brackets=40):
+    '''Gather lower bracket bounds and cumulative percents to plot'''
+
+    # Only do first 40 income brackets
+    range_list = [line[0][0] for line in master_list[:n_brackets]]
+    percentage_list = [line[3] for line in master_list[:n_brackets]]
+
+    return range_list, percentage_list
 
 
 def open_file():
@@ -94,25 +160,8 @@ def open_file():
 def handle_commas(s, T):
     '''Converts strings to ints/floats, removes commas, ignores strings'''
 
-    # Remove Commas
-    format_list = s.split(",")
-    format_str = "".join(format_list)
-
-    # Convert string to int
-    if T == "int":
-        try:
-            out_int = int(format_str)
-            return out_int
-        except ValueError:
-            return None
-
-    # Convert string to float
-    if T == "float":
-        try:
-            out_float = float(format_str)
-            return out_float
-        except ValueError:
-            return None
+    # Shared parser returns None for empty or non-numeric cells
+    return numParse.parse_number(s, T)
 
 
 def read_file(fp):
@@ -122,38 +171,31 @@ def read_file(fp):
     fp.readline()
     fp.readline()
 
-    # Read each line, format and extract data
-    master_list = []
-    for line in fp:
-        line_list = line.split()
-
-        # Handle commas, convert to ints and floats for elements in line_list
-        count = 0
-        for num in line_list:
-
-            if count == 3 or count == 4:
-                line_list[count] = handle_commas(num, "int")
-            else:
-                line_list[count] = handle_commas(num, "float")
-
-            count += 1
-
-        # Extract Coumns 1 through 7
-        interval_tuple = line_list[0], line_list[2]
-
-        # Make space for and append interval_tuple to line_list
-        line_list.pop(2)
-        line_list[0] = interval_tuple
+    # Split each line into its 8 cells: low, dash, high, then 5 numbers
+    row_list = [line.split() for line in fp if line.strip() != ""]
+    for line_list in row_list:
+        if len(line_list) != 8:
+            raise ValueError("Expected 8 columns: " + " ".join(line_list))
+
+    # Convert whole columns at once, columns 3 and 4 are counts
+    column_list = []
+    for count, cells in enumerate(zip(*row_list)):
+        # Skip the dash between the bracket bounds
+        if count == 1:
+            continue
 
-        # Get Rid of weird character (now a NoneType)
-        line_list.pop(1)
+        T = "int" if count == 3 or count == 4 else "float"
+        values, valid, bad_list = numParse.parse_column(cells, T)
+        column_list.append(numParse.column_to_list(values, valid))
 
-        line_tup = tuple(line_list)
-        master_list.append(line_tup)
+    if len(column_list) == 0:
+        return []
+    low, high, number, cumulative, percent, amount, average = column_list
 
     # Return list of tuples: ((float, float), int, int, float, float, float)
     # ((column 0, column 2), column 3, column 4, column 5, column 6, column 7)
-    return master_list
+    return list(zip(zip(low, high), number, cumulative, percent, amount,
+                    average))
 
 
 def find_average(data_lst):
@@ -175,31 +217,246 @@ def find_average(data_lst):
 def find_median(data_lst):
     '''Find average income of range closest to 50% of total population'''
 
-    for line in data_lst:
-        # Returns average income of first range to exceed 50% of the population
-        if line[3] >= 50:
-            # Line 5 = column 7, average income
-            return line[5]
+    # Binary search for the first range to reach 50% of the population
+    i = bisect.bisect_left(data_lst, 50, key=itemgetter(3))
+    if i < len(data_lst):
+        # Line 5 = column 7, average income
+        return data_lst[i][5]
 
 
 def get_range(data_lst, percent):
     '''Finds income bracket closest to given percent of population'''
 
-    for line in data_lst:
-        # Selects first percentage close to percent
-        if line[3] >= percent:
-            # Range, percent, average income
-            return line[0], line[3], line[5]
+    # Cumulative percent only grows, binary search for the first >= percent
+    i = bisect.bisect_left(data_lst, percent, key=itemgetter(3))
+    if i < len(data_lst):
+        # Range, percent, average income
+        line = data_lst[i]
+        return line[0], line[3], line[5]
 
 
 def get_percent(data_lst, salary):
     '''Finds income bracket containing given salary'''
 
-    for line in data_lst:
-        # Checks if salary is within range boundaries
-        if line[0][0] <= salary and line[0][1] >= salary:
-            # Range, percent
-            return line[0], line[3]
+    # Last bracket whose lower boundary is at or below salary
+    i = bisect.bisect_right(data_lst, salary, key=lambda line: line[0][0]) - 1
+    if i < 0:
+        return None
+
+    # Checks if salary is within range boundaries, top bracket has no upper
+    line = data_lst[i]
+    if line[0][1] is None or line[0][1] >= salary:
+        # Range, percent
+        return line[0], line[3]
+
+
+def build_distribution(data_lst):
+    '''Build bracket boundary and cumulative percent arrays once'''
+
+    # Open top bracket gets an infinite upper boundary
+    return {"low": np.array([line[0][0] for line in data_lst], dtype=float),
+            "high": np.array([np.inf if line[0][1] is None else line[0][1]
+                              for line in data_lst], dtype=float),
+            "percent": np.array([line[3] for line in data_lst], dtype=float),
+            "average": np.array([line[5] for line in data_lst], dtype=float)}
+
+
+def bracket_index(edges, values, side):
+    '''Count bracket edges below each value, one row per year'''
+
+    # Single year: binary search
+    if edges.ndim == 1:
+        return np.searchsorted(edges, values, side=side)[None, :]
+
+    # Stacked years: one binary search per year over its non-nan edges,
+    # O(values) extra memory instead of a years x values x edges mask
+    counts = np.empty((edges.shape[0], len(values)), dtype=np.int64)
+    n_edges = np.sum(~np.isnan(edges), axis=1)
+    for row in range(edges.shape[0]):
+        counts[row] = np.searchsorted(edges[row, :n_edges[row]], values,
+                                      side=side)
+
+    return counts
+
+
+def percentile_of(dist, salaries, interpolate=False):
+    '''Cumulative percent of population at each salary, vectorized'''
+
+    salaries = np.asarray(salaries, dtype=float)
+    flat = salaries.reshape(-1)
+    low = np.atleast_2d(dist["low"])
+    high = np.atleast_2d(dist["high"])
+    percent = np.atleast_2d(dist["percent"])
+
+    # Bracket holding each salary, -1 below the lowest bracket. Non-finite
+    # salaries fall in no bracket
+    i = bracket_index(dist["low"], flat, "right") - 1
+    inside = (i >= 0) & np.isfinite(flat)
+    i = np.maximum(i, 0)
+
+    # Without interpolation a salary gets its bracket's cumulative percent
+    result = np.take_along_axis(percent, i, axis=1)
+
+    # Otherwise move linearly from the previous bracket's percent
+    if interpolate:
+        prev = np.take_along_axis(percent, np.maximum(i - 1, 0), axis=1)
+        prev = np.where(i > 0, prev, 0.0)
+        bottom = np.take_along_axis(low, i, axis=1)
+        width = np.take_along_axis(high, i, axis=1) - bottom
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.clip((flat - bottom)/width, 0.0, 1.0)
+        frac = np.where(np.isfinite(width) & (width > 0), frac, 1.0)
+        result = prev + frac*(result - prev)
+
+    # One value per salary, with a leading year axis for stacked years
+    result = np.where(inside, result, np.nan)
+    return result.reshape(np.shape(dist["low"])[:-1] + salaries.shape)
+
+
+def income_at(dist, percents, interpolate=False):
+    '''Income at each cumulative percent of population, vectorized'''
+
+    percents = np.asarray(percents, dtype=float)
+    flat = percents.reshape(-1)
+    low = np.atleast_2d(dist["low"])
+    high = np.atleast_2d(dist["high"])
+    percent = np.atleast_2d(dist["percent"])
+
+    # First bracket reaching each percent, like get_range. Non-finite
+    # percents reach no bracket
+    i = bracket_index(dist["percent"], flat, "left")
+    inside = (i < np.sum(~np.isnan(percent), axis=1)[:, None]) & \
+        np.isfinite(flat)
+    i = np.minimum(i, percent.shape[1] - 1)
+
+    # Without interpolation return the bracket's lower boundary
+    result = np.take_along_axis(low, i, axis=1)
+
+    # Otherwise move linearly across the bracket from its lower boundary
+    if interpolate:
+        prev = np.take_along_axis(percent, np.maximum(i - 1, 0), axis=1)
+        prev = np.where(i > 0, prev, 0.0)
+        top = np.take_along_axis(percent, i, axis=1)
+        width = np.take_along_axis(high, i, axis=1) - result
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.clip((flat - prev)/(top - prev), 0.0, 1.0)
+        frac = np.where(np.isfinite(frac), frac, 0.0)
+        result = np.where(np.isfinite(width), result + frac*width, result)
+
+    # One value per percent, with a leading year axis for stacked years
+    result = np.where(inside, result, np.nan)
+    return result.reshape(np.shape(dist["low"])[:-1] + percents.shape)
+
+
+def find_year_files(directory="."):
+    '''Find every yearXXXX.txt file in a directory, keyed by year'''
+
+    year_dict = {}
+    for file_str in glob.glob(os.path.join(directory, "year*.txt")):
+        year_str = os.path.basename(file_str)[4:-4]
+        if year_str.isdigit():
+            year_dict[int(year_str)] = file_str
+
+    return dict(sorted(year_dict.items()))
+
+
+def read_year_file(file_str):
+    '''Open and read one year file through the parsed-data cache'''
+
+    fp = open(file_str, 'r', encoding="utf8")
+    return dataCache.cached_read(fp, read_file, "financialGrapher.read_file")
+
+
+def load_years(directory=".", workers=None):
+    '''Read every year file in a directory concurrently'''
+
+    file_dict = find_year_files(directory)
+
+    # One year file per task, results come back in year order
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        data_list = list(pool.map(read_year_file, file_dict.values()))
+
+    # Return dictionary with key=year, value=master list
+    return dict(zip(file_dict.keys(), data_list))
+
+
+def build_cube(year_dict):
+    '''Stack each year's brackets into year x bracket arrays'''
+
+    years = sorted(year_dict)
+    n_brackets = max([len(year_dict[y]) for y in years], default=0)
+
+    # Years with fewer brackets are padded with nan
+    cube = {"years": np.array(years, dtype=int)}
+    for name in ["low", "high", "number", "cumulative", "percent", "amount",
+                 "average"]:
+        cube[name] = np.full((len(years), n_brackets), np.nan)
+
+    for row, year in enumerate(years):
+        dist = build_distribution(year_dict[year])
+        n = len(year_dict[year])
+        for name in ["low", "high", "percent", "average"]:
+            cube[name][row, :n] = dist[name]
+        cube["number"][row, :n] = [line[1] for line in year_dict[year]]
+        cube["cumulative"][row, :n] = [line[2] for line in year_dict[year]]
+        cube["amount"][row, :n] = [line[4] for line in year_dict[year]]
+
+    return cube
+
+
+def cube_average(cube):
+    '''Average salary for every year at once, like find_average'''
+
+    # Total money over total people surveyed, per year
+    avg = np.nansum(cube["amount"], axis=1)/np.nanmax(cube["cumulative"],
+                                                     axis=1)
+    return np.round(avg, 2)
+
+
+def cube_median(cube):
+    '''Median for every year at once, like find_median'''
+
+    # First bracket per year to reach 50% of the population
+    reached = cube["percent"] >= 50
+    i = np.argmax(reached, axis=1)
+    median = cube["average"][np.arange(len(i)), i]
+
+    return np.where(reached.any(axis=1), median, np.nan)
+
+
+def cube_bracket(cube, row, i):
+    '''One bracket of a cube row as ((low, high), percent, average)'''
+
+    # Open top bracket goes back to a None upper boundary
+    high = float(cube["high"][row, i])
+    return ((float(cube["low"][row, i]), None if np.isinf(high) else high),
+            float(cube["percent"][row, i]), float(cube["average"][row, i]))
+
+
+def cube_range(cube, row, percent):
+    '''Get_range() on one year of a cube'''
+
+    # Same first bracket reaching percent as income_at, nan padding sorts last
+    i = int(bracket_index(cube["percent"][row], [percent], "left")[0, 0])
+    if i < np.sum(~np.isnan(cube["percent"][row])):
+        # Range, percent, average income
+        return cube_bracket(cube, row, i)
+
+
+def cube_percent(cube, row, salary):
+    '''Get_percent() on one year of a cube'''
+
+    # Same bracket as percentile_of, the last lower boundary at or below
+    n = np.sum(~np.isnan(cube["low"][row]))
+    i = int(bracket_index(cube["low"][row, :n], [salary], "right")[0, 0]) - 1
+    if i < 0:
+        return None
+
+    # Checks if salary is within range boundaries, top bracket has no upper
+    bracket, percent, average = cube_bracket(cube, row, i)
+    if bracket[1] is None or bracket[1] >= salary:
+        # Range, percent
+        return bracket, percent
 
 
 def main():
@@ -209,7 +466,9 @@ def main():
 
     print("For the year {:4d}:".format(year_int))
 
-    master_list = read_file(fp)
+    # Parsed brackets are cached on disk until the year file changes
+    master_list = dataCache.cached_read(fp, read_file,
+                                        "financialGrapher.read_file")
 
     print("The average income was ${:<13,.2f}".format(
         find_average(master_list)))
@@ -218,19 +477,8 @@ def main():
     check_str = input("Do you want to plot the data (yes/no): ")
     if check_str.lower() == "yes":
 
-        range_list = []
-        percentage_list = []
-        count = 0
-
         # Gather x and y values from master_list
-        for line in master_list:
-            range_list.append(line[0][0])
-            percentage_list.append(line[3])
-
-            # Only do first 40 income brackets
-            if count == 39:
-                break
-            count += 1
+        range_list, percentage_list = plot_values(master_list)
 
         do_plot(range_list, percentage_list, year_int)
 
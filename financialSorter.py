@@ -5,15 +5,61 @@ Income Data Sorter By State and County
         Open file for reading, prompt until successful
     Get_County_State():
         Extract county and state from string
+    Iter_Counties():
+        Yield (state, county, median_income, fips) records one at a time
+    Read_Columns():
+        Read state, county, income and FIPS columns of a county CSV
     Read_File():
-        Loop through file, make tuple list (state, county, median_income)
+        Loop through file, make county table (state, county, median_income)
+    Load_County_Table():
+        Read data.csv from a directory into a cached county table
+    Chunk_Offsets():
+        Split a CSV file at record-safe byte offsets, skipping the header
+    Read_Chunk():
+        Parse one byte range of a CSV file into county columns
+    Read_File_Parallel():
+        Parse the file in chunks on a process pool, make county table
+    Stream_State_Stats():
+        Count, sum, min, max and mean income per state over a record stream
+    Stream_Top_K():
+        Find top (or bottom) k counties over a record stream
+    Build_County_Table():
+        Pack (state, county, median_income, fips) records into columns
+    Build_County_Columns():
+        Sort parsed county columns by income into an indexed county table
+    Build_Indexes():
+        Build state slice and FIPS indexes over the county table
+    Group_Offsets():
+        Start offsets of each code's group once rows are sorted by code
+    Group_Stats():
+        Count, sum, mean, min, max, median of groups in a decreasing array
+    County_Name():
+        Look up a county name in the table's string pool
+    Table_Rows():
+        Convert table rows back into (state, county, median_income) tuples
+    State_Code():
+        Find the integer code for a 2-letter state, None if not present
 
     State_Average_Income():
         Find income average for counties in state
+    State_Rows():
+        Find a state's rows in decreasing income (or name) order
+    Join_By_Fips():
+        Find the table row for each FIPS code, -1 where it is missing
+    Lookup_Fips():
+        Find the (state, county, median_income) tuple for a FIPS code
+    Top_K_Counties():
+        Find top k counties by median income, optionally in one state
+    Bottom_K_Counties():
+        Find bottom k counties by median income, optionally in one state
     Top_Counties_By_Income():
         Find top ten income counties in decreasing order
     Bottom_Counties_By_Income():
         Find the bottom ten income counties in decreasing order
+    State_Stats():
+        Group incomes by state: count, sum, mean, min, max, median
+    Rank_States():
+        Order states by average median income from the group-by
     Top_States_By_Income():
         Find top ten income states in decreasing order
     Bottom_States_By_Income():
@@ -21,12 +67,18 @@ Income Data Sorter By State and County
     Counties_In_State():
         Find tuple list with counties, incomes sorted alphabetically
 
+    Run_Query():
+        Run one batch query line, return a list of result rows
+    Run_Batch():
+        Run every query line from a file, write JSON lines or CSV
+
     Display_Options():
         Display menu of options for program, take option input
 
     Main():
         Open_file()
         Read_File()
+        Batch mode: Run_Batch()
         User Input Loop
             Display_Options()
             Option Decision Tree
@@ -40,15 +92,32 @@ Income Data Sorter By State and County
 """
 
 # Import Library
+import argparse
 import csv
-from operator import itemgetter
+import heapq
+import io
+import itertools
+import json
+import mmap
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dataCache
+import numParse
+import stateIds
 
 # Constants
-STATES = ["AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DC", "DE", "FL", "GA",
-          "HI", "ID", "IL", "IN", "IA", "KS", "KY", "LA", "ME", "MD",
-          "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ",
-          "NM", "NY", "NC", "ND", "OH", "OK", "OR", "PA", "RI", "SC",
-          "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY"]
+# 2-letter codes, index in this list is the shared state ID
+STATES = stateIds.ABBREVIATIONS[:stateIds.N_STATES]
+
+STAT_NAMES = ["count", "sum", "mean", "min", "max", "median"]
+ARG_QUERIES = ["state_avg", "counties_in_state", "state_stats", "fips"]
+QUERY_NAMES = ["top_counties", "bottom_counties", "top_states",
+               "bottom_states"] + ARG_QUERIES
 
 
 def open_file(ch):
@@ -84,146 +153,583 @@ def get_county_state(s):
     return county, state
 
 
-def read_file(fp):
-    """ Loop through file, make tuple list (state, county, median_income)"""
+def iter_counties(fp):
+    """Yield (state, county, median_income, fips) records one at a time"""
 
     # Skip Header
     fp.readline()
 
-    # Read file, extract columns 1 and 10, put into place name and income lists
-    name_list = []
-    income_list = []
+    # Read file, extract columns 0, 1 and 10: FIPS, place name and income
     reader = csv.reader(fp)
-
     for line_list in reader:
-        name_list.append(line_list[1])
 
-        # Remove Commas from income
-        if line_list[10] != "":
-            format_list = line_list[10].split(",")
-            format_str = "".join(format_list)
-            income_list.append(int(format_str))
-        else:
-            income_list.append(line_list[10])
+        # If there is no value for income, ignore that county
+        if line_list[10] == "":
+            continue
 
-    # Separate state and county, match up place with income
-    stats_list = []
-    income_count = 0
+        # Remove Commas from income, report cells that are not numbers
+        income = numParse.parse_number(line_list[10], "int")
+        if income is None:
+            raise ValueError("Bad income for {}: {!r}".format(
+                line_list[1], line_list[10]))
 
-    for name in name_list:
         # Call the get_county_state to separate the county and state
-        county, state = get_county_state(name)
-        stats_tuple = state, county, income_list[income_count]
+        county, state = get_county_state(line_list[1])
+        fips = numParse.parse_number(line_list[0], "int", -1)
 
-        # If there is no value for income, ignore that county
-        if stats_tuple[2] != "":
-            stats_list.append(stats_tuple)
+        yield state, county, income, fips
+
+
+def read_columns(fp):
+    """Read state, county, income and FIPS columns of a county CSV"""
+
+    # Skip Header
+    fp.readline()
+
+    # Keep columns 0, 1 and 10 (FIPS, place name, income) of every county
+    # that has an income, numbers are converted a column at a time below
+    row_list = [(line_list[0], line_list[1], line_list[10])
+                for line_list in csv.reader(fp) if line_list[10] != ""]
+    fips_cells = [row[0] for row in row_list]
+    name_cells = [row[1] for row in row_list]
+    income_cells = [row[2] for row in row_list]
+    del row_list
+
+    # Remove Commas from income, report cells that are not numbers
+    income, valid, bad_list = numParse.parse_column(income_cells, "int")
+    if len(bad_list) > 0:
+        i, text = bad_list[0]
+        raise ValueError("Bad income for {}: {!r}".format(name_cells[i],
+                                                          text))
+
+    # FIPS codes that are missing or not numbers become -1
+    fips, valid, bad_list = numParse.parse_column(fips_cells, "int")
+    fips[~valid] = -1
+
+    # Call the get_county_state to separate the county and state
+    place_list = [get_county_state(name) for name in name_cells]
+    state_list = [place[1] for place in place_list]
+    county_list = [place[0] for place in place_list]
+
+    return state_list, county_list, income, fips
+
+
+def read_file(fp):
+    """ Loop through file, make county table (state, county, median_income)"""
+
+    # Return a county table in decreasing order of median_income
+    return build_county_columns(*read_columns(fp))
+
+
+def load_county_table(directory="."):
+    """Read data.csv from a directory into a cached county table"""
+
+    fp = open(os.path.join(directory, "data.csv"), "r")
+    return dataCache.cached_read(fp, read_file, "financialSorter.read_file")
+
+
+def chunk_offsets(file_str, n_chunks):
+    """Split a CSV file at record-safe byte offsets, skipping the header"""
+
+    with open(file_str, "rb") as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return [0, 0]
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Data starts after the header line
+    start = data.find(b"\n") + 1 or len(data)
+    offsets = [start]
+
+    # Move each target forward to a newline outside any quoted field,
+    # an even number of quotes before a newline means it ends a record
+    quotes = data[:start].count(b'"')
+    pos = start
+    for i in range(1, n_chunks):
+        target = max(start + (len(data) - start)*i//n_chunks, offsets[-1])
+        while True:
+            newline = data.find(b"\n", target)
+            if newline < 0:
+                break
+            quotes += data[pos:newline].count(b'"')
+            pos = newline
+            if quotes % 2 == 0:
+                break
+            target = newline + 1
+        if newline < 0:
+            break
+        if newline + 1 > offsets[-1]:
+            offsets.append(newline + 1)
+
+    offsets.append(len(data))
+    data.close()
+    return offsets
+
+
+def read_chunk(args):
+    """Parse one byte range of a CSV file into county columns"""
+
+    file_str, begin, end = args
+    with open(file_str, "rb") as fp:
+        fp.seek(begin)
+        text = fp.read(end - begin).decode("utf8")
+
+    # Put back a dummy header line for read_columns to skip
+    return read_columns(io.StringIO("\n" + text, newline=""))
+
+
+def read_file_parallel(file_str, workers=None):
+    """Parse the file in chunks on a process pool, make county table"""
+
+    workers = workers or os.cpu_count() or 1
+    offsets = chunk_offsets(file_str, workers*4)
+    chunk_list = [(file_str, offsets[i], offsets[i + 1])
+                  for i in range(len(offsets) - 1)]
+
+    # Chunks come back in file order, so rows match the serial read
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        part_list = list(pool.map(read_chunk, chunk_list))
+
+    return build_county_columns(
+        list(itertools.chain.from_iterable(p[0] for p in part_list)),
+        list(itertools.chain.from_iterable(p[1] for p in part_list)),
+        np.concatenate([p[2] for p in part_list]),
+        np.concatenate([p[3] for p in part_list]))
+
+
+def stream_state_stats(records):
+    """Count, sum, min, max and mean income per state over a record stream"""
+
+    # One small running entry per state, memory does not grow with rows
+    stats_dict = {}
+    for state, county, income, fips in records:
+        entry = stats_dict.get(state)
+        if entry is None:
+            stats_dict[state] = [1, income, income, income]
+        else:
+            entry[0] += 1
+            entry[1] += income
+            entry[2] = min(entry[2], income)
+            entry[3] = max(entry[3], income)
+
+    # Return dictionary with key=state, value=dictionary of statistics
+    return {state: {"count": e[0], "sum": e[1], "min": e[2], "max": e[3],
+                    "mean": e[1]/e[0]}
+            for state, e in stats_dict.items()}
+
+
+def stream_top_k(records, k=10, bottom=False, state=None):
+    """Find top (or bottom) k (state, county, median_income) over a stream"""
+
+    # Heap of k entries, ties break on file order the way the table does
+    heap = []
+    sign = -1 if bottom else 1
+    for seq, (rec_state, county, income, fips) in enumerate(records):
+        if state is not None and rec_state != state:
+            continue
+        entry = (sign*income, -sign*seq, (rec_state, county, income))
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif k > 0 and entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+
+    # Return a list of tuples in decreasing order of median_income
+    rows = [e[2] for e in sorted(heap, reverse=True)]
+    return rows[::-1] if bottom else rows
+
+
+def build_county_table(stats_list):
+    """Pack (state, county, median_income, fips) records into columns"""
+
+    # Numbers go into typed arrays, not lists of Python ints
+    state_list = []
+    county_list = []
+    income_list = array("q")
+    fips_list = array("q")
+    for state, county, income, fips in stats_list:
+        state_list.append(state)
+        county_list.append(county)
+        income_list.append(income)
+        fips_list.append(fips)
+
+    return build_county_columns(state_list, county_list,
+                                np.frombuffer(income_list, dtype=np.int64),
+                                np.frombuffer(fips_list, dtype=np.int64))
+
+
+def build_county_columns(state_list, county_list, income, fips):
+    """Sort parsed county columns by income into an indexed county table"""
+
+    # State codes are shared state IDs, unknown codes are appended.
+    # Resolve each distinct state string once, in file order
+    state_names = list(stateIds.ABBREVIATIONS)
+    code_dict = {}
+    for state in dict.fromkeys(state_list):
+        code = stateIds.state_id(state)
+        if code is None:
+            code = len(state_names)
+            state_names.append(state)
+        code_dict[state] = code
+    codes = np.fromiter(map(code_dict.__getitem__, state_list),
+                        dtype=np.int16, count=len(state_list))
+
+    # Decreasing order of median_income, ties keep file order
+    order = np.argsort(-income, kind="stable")
+    county_list = [county_list[i] for i in order.tolist()]
+
+    # County names live in one string pool, row i is pool[off[i]:off[i+1]]
+    offsets = np.zeros(len(county_list) + 1, dtype=np.int64)
+    np.cumsum([len(county) for county in county_list], out=offsets[1:])
+
+    # Table is a dictionary of columns, all rows share the same order
+    master_table = {"state_names": state_names,
+                    "state": codes[order],
+                    "county_pool": "".join(county_list),
+                    "county_offsets": offsets,
+                    "income": income[order],
+                    "fips": fips[order]}
+
+    build_indexes(master_table, county_list)
+    return master_table
+
+
+def build_indexes(master_table, names):
+    """Build state slice and FIPS indexes over the county table"""
+
+    codes = master_table["state"]
+    n_states = len(master_table["state_names"])
+
+    # Rows of state code c are by_income[offsets[c]:offsets[c + 1]]
+    # Grouped by state, in decreasing income order within each state
+    master_table["state_offsets"] = group_offsets(codes, n_states)
+    master_table["by_income"] = np.argsort(codes, kind="stable")
+
+    # Grouped by state, alphabetical within each state (ties by income).
+    # Sort row numbers by name, no fixed-width copy of the names
+    name_order = np.array(sorted(range(len(names)), key=names.__getitem__),
+                          dtype=np.int64)
+    master_table["by_name"] = name_order[np.argsort(codes[name_order],
+                                                    kind="stable")]
+
+    # Sorted FIPS codes with their rows for binary search lookups
+    fips_order = np.argsort(master_table["fips"], kind="stable")
+    master_table["fips_sorted"] = master_table["fips"][fips_order]
+    master_table["fips_rows"] = fips_order
+
+
+def group_offsets(codes, n_groups):
+    """Start offsets of each code's group once rows are sorted by code"""
+
+    counts = np.bincount(codes, minlength=n_groups)
+    offsets = np.zeros(n_groups + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return offsets
+
+
+def group_stats(values, offsets):
+    """Count, sum, mean, min, max, median of groups in a decreasing array
+
+    Group g is values[offsets[g]:offsets[g + 1]], sorted in decreasing
+    order. Empty groups get a count of 0 and nan mean and median.
+    """
 
-        income_count += 1
+    n_groups = len(offsets) - 1
+    stats = {"count": np.zeros(n_groups, dtype=np.int64),
+             "sum": np.zeros(n_groups, dtype=values.dtype),
+             "mean": np.full(n_groups, np.nan),
+             "min": np.zeros(n_groups, dtype=values.dtype),
+             "max": np.zeros(n_groups, dtype=values.dtype),
+             "median": np.full(n_groups, np.nan)}
+
+    counts = np.diff(offsets)
+    group = np.flatnonzero(counts)
+
+    if len(group) > 0:
+        starts = offsets[group]
+        counts = counts[group]
+
+        stats["count"][group] = counts
+        stats["sum"][group] = np.add.reduceat(values, starts)
+        stats["mean"][group] = stats["sum"][group]/counts
+        stats["max"][group] = values[starts]
+        stats["min"][group] = values[starts + counts - 1]
+
+        # Middle one or two values of each decreasing group
+        stats["median"][group] = (values[starts + (counts - 1)//2] +
+                                  values[starts + counts//2])/2
+
+    return stats
+
+
+def county_name(master_table, row):
+    """Look up a county name in the table's string pool"""
+
+    offsets = master_table["county_offsets"]
+    name = master_table["county_pool"][offsets[row]:offsets[row + 1]]
+
+    # Mapped tables keep the pool as raw UTF-8 bytes
+    return name if isinstance(name, str) else bytes(name).decode("utf8")
+
+
+def table_rows(master_table, rows):
+    """Convert table rows back into (state, county, median_income) tuples"""
+
+    state_names = master_table["state_names"]
+    state = master_table["state"][rows].tolist()
+    income = master_table["income"][rows].tolist()
 
     # Return a list of tuples (state, county, median_income)
-    # in decreasing order of median_income
-    return sorted(stats_list, key=itemgetter(2), reverse=True)
+    return [(state_names[s], county_name(master_table, row), i)
+            for row, s, i in zip(np.asarray(rows).tolist(), state, income)]
+
+
+def state_code(state, master_table):
+    """Find the integer code for a 2-letter state, None if not present"""
 
+    # Shared state IDs first, then codes only this table knows
+    code = stateIds.state_id(state)
+    if code is None and state in master_table["state_names"]:
+        code = master_table["state_names"].index(state)
 
-def state_average_income(state, master_list):
+    return code
+
+
+def state_average_income(state, master_table):
     """Find median income average for counties in state"""
 
     # Check for incorrect spelling
-    if state not in STATES:
+    code = state_code(state, master_table)
+    if code is None:
         return None
 
-    # Add up incomes
-    total = 0
-    count = 0
-    for county_tuple in master_list:
-        if county_tuple[0] == state:
-            total += county_tuple[2]
-            count += 1
+    # Look up the state's totals in the cached group-by
+    stats = state_stats(master_table)
+    count = int(stats["count"][code])
 
     # Check for wrong state
     if count == 0:
         return None
 
-    avg = total/count
+    avg = int(stats["sum"][code])/count
 
     return round(avg, 2)
 
 
-def top_counties_by_income(master_list):
-    """Find top ten counties by median income in decreasing order"""
+def state_rows(master_table, state, key="by_income"):
+    """Find a state's rows in decreasing income (or by_name) order"""
+
+    code = state_code(state, master_table)
+    if code is None:
+        return np.zeros(0, dtype=np.int64)
+
+    # Contiguous slice of the state index
+    offsets = master_table["state_offsets"]
+    return master_table[key][offsets[code]:offsets[code + 1]]
+
+
+def join_by_fips(master_table, fips_codes):
+    """Find the table row for each FIPS code, -1 where it is missing"""
+
+    fips_sorted = master_table["fips_sorted"]
+    fips_codes = np.asarray(fips_codes, dtype=np.int64)
+    if len(fips_sorted) == 0:
+        return np.full(fips_codes.shape, -1, dtype=np.int64)
+
+    # Binary search every code at once, then check for exact matches
+    pos = np.searchsorted(fips_sorted, fips_codes)
+    pos = np.minimum(pos, len(fips_sorted) - 1)
+    found = fips_sorted[pos] == fips_codes
+
+    return np.where(found, master_table["fips_rows"][pos], -1)
+
+
+def lookup_fips(master_table, fips):
+    """Find the (state, county, median_income) tuple for a FIPS code"""
+
+    # Codes past int64 cannot be in the table
+    limits = np.iinfo(np.int64)
+    if not limits.min <= fips <= limits.max:
+        return None
+
+    row = int(join_by_fips(master_table, [fips])[0])
+    if row < 0:
+        return None
+
+    return table_rows(master_table, [row])[0]
+
+
+def top_k_counties(master_table, k=10, state=None):
+    """Find top k counties by median income in decreasing order"""
+
+    k = max(k, 0)
+
+    # Presorted table, the first k rows are the top k
+    if state is None:
+        rows = np.arange(min(k, len(master_table["income"])))
+    else:
+        rows = state_rows(master_table, state)[:k]
 
-    income_order_list = sorted(master_list, key=itemgetter(2), reverse=True)
-    top_ten_list = income_order_list[0:10]
+    return table_rows(master_table, rows)
 
-    return top_ten_list
 
+def bottom_k_counties(master_table, k=10, state=None):
+    """Find bottom k counties by median income in decreasing order"""
 
-def bottom_counties_by_income(master_list):
+    k = max(k, 0)
+    n = len(master_table["income"])
+
+    # Presorted table, the last k rows are the bottom k
+    if state is None:
+        rows = np.arange(max(n - k, 0), n)
+    else:
+        rows = state_rows(master_table, state)
+        rows = rows[max(len(rows) - k, 0):]
+
+    return table_rows(master_table, rows)
+
+
+def top_counties_by_income(master_table):
+    """Find top ten counties by median income in decreasing order"""
+
+    return top_k_counties(master_table, 10)
+
+
+def bottom_counties_by_income(master_table):
     """Find the bottom ten counties by median incomes in decreasing order"""
 
-    income_order_list = sorted(master_list, key=itemgetter(2), reverse=True)
-    bottom_ten_list = income_order_list[-10:]
+    return bottom_k_counties(master_table, 10)
 
-    return bottom_ten_list
 
+def state_stats(master_table):
+    """Group incomes by state: count, sum, mean, min, max, median"""
 
-def top_states_by_income(master_list):
-    """Find top ten states by average median incomes in decreasing order"""
+    # Computed once per table, later calls reuse the cached result
+    if "state_stats" in master_table:
+        return master_table["state_stats"]
 
-    # Call state_average_income for each state, sort
-    avg_list = []
-    for state in STATES:
-        # Make list of each state and average income in tuples
-        stats_list = [state, state_average_income(state, master_list)]
+    # State index keeps each group contiguous, in decreasing income order
+    income = master_table["income"][master_table["by_income"]]
+    stats = group_stats(income, master_table["state_offsets"])
 
-        # Check if income value is empty
-        try:
-            float(stats_list[1])
-            avg_list.append(stats_list)
-        except TypeError:
-            continue
+    master_table["state_stats"] = stats
+    return stats
 
-    # Return tuple list where each tuple is (state, average_median_income)
-    avg_list = sorted(avg_list, key=itemgetter(1), reverse=True)
-    return avg_list[0:10]
 
+def rank_states(master_table, reverse):
+    """Order [state, average_median_income] pairs from the state group-by"""
 
-def bottom_states_by_income(master_list):
-    """Find bottom ten counties by median incomes in decreasing order"""
+    stats = state_stats(master_table)
 
-    # Call state_average_income for each state, sort
+    # Keep states in STATES order, skip states without counties
     avg_list = []
-    for state in STATES:
-        # Make list of each state and average income in tuples
-        stats_list = [state, state_average_income(state, master_list)]
+    for code, state in enumerate(STATES):
+        if stats["count"][code] > 0:
+            avg_list.append([state, round(float(stats["mean"][code]), 2)])
 
-        # Check if income value is empty
-        try:
-            float(stats_list[1])
-            avg_list.append(stats_list)
-        except TypeError:
-            continue
+    # Stable sort so ties stay in STATES order
+    avg = np.array([e[1] for e in avg_list])
+    order = np.argsort(-avg if reverse else avg, kind="stable")
+    return [avg_list[i] for i in order]
+
+
+def top_states_by_income(master_table):
+    """Find top ten states by average median incomes in decreasing order"""
 
-    # Return tuple list where each tuple is (state, average_median_income)
-    avg_list = sorted(avg_list, key=itemgetter(1))
-    return avg_list[:10]
+    # Return list where each element is [state, average_median_income]
+    return rank_states(master_table, True)[0:10]
 
 
-def counties_in_state(state, master_list):
+def bottom_states_by_income(master_table):
+    """Find bottom ten counties by median incomes in decreasing order"""
+
+    # Return list where each element is [state, average_median_income]
+    return rank_states(master_table, False)[:10]
+
+
+def counties_in_state(state, master_table):
     """Find tuple list with counties, median incomes sorted alphabetically"""
 
-    # Find counties in state, extract name and income
-    county_list = []
-    for in_tuple in master_list:
-        # Check if county is in state
-        if in_tuple[0] == state:
-            stats_list = tuple([in_tuple[1], in_tuple[2]])
-            county_list.append(stats_list)
+    # State's slice of the name index is already alphabetical
+    rows = state_rows(master_table, state, "by_name")
 
     # Return a list of tuples (county, median_income)
-    county_tuple = sorted(county_list, key=itemgetter(0))
-    return county_tuple
+    return [(e[1], e[2]) for e in table_rows(master_table, rows)]
+
+
+def run_query(query_str, master_table):
+    """Run one batch query line, return a list of result rows"""
+
+    # Query name followed by its arguments, e.g. "top_counties 25 CA"
+    word_list = query_str.split()
+    name = word_list[0].lower()
+    args = [w.upper() for w in word_list[1:]]
+    if name in ARG_QUERIES and len(args) == 0:
+        raise ValueError(name + " needs an argument")
+
+    # Optional count argument, ten like the menu by default
+    def count(i):
+        return int(args[i]) if len(args) > i else 10
+
+    # Optional state argument after the count
+    def state(i):
+        return args[i] if len(args) > i else None
+
+    if name == "state_avg":
+        return [[args[0], state_average_income(args[0], master_table)]]
+    elif name == "top_counties":
+        return top_k_counties(master_table, count(0), state(1))
+    elif name == "bottom_counties":
+        return bottom_k_counties(master_table, count(0), state(1))
+    elif name == "top_states":
+        return rank_states(master_table, True)[:count(0)]
+    elif name == "bottom_states":
+        return rank_states(master_table, False)[:count(0)]
+    elif name == "counties_in_state":
+        return counties_in_state(args[0], master_table)
+    elif name == "state_stats":
+        code = state_code(args[0], master_table)
+        stats = state_stats(master_table)
+        if code is None or stats["count"][code] == 0:
+            return []
+        return [[args[0]] + [stats[k][code].item() for k in STAT_NAMES]]
+    elif name == "fips":
+        county = lookup_fips(master_table, int(args[0]))
+        return [] if county is None else [county]
+    else:
+        raise ValueError("unknown query: " + name)
+
+
+def run_batch(master_table, in_fp, out_fp, out_format="json"):
+    """Run every query line from in_fp, write JSON lines or CSV to out_fp"""
+
+    writer = csv.writer(out_fp)
+    for line in in_fp:
+        query_str = line.strip()
+
+        # Skip blank lines and comments
+        if query_str == "" or query_str.startswith("#"):
+            continue
+
+        # Bad queries become error records, the batch keeps going
+        try:
+            result_list = [list(row) for row in
+                           run_query(query_str, master_table)]
+            error = None
+        except (ValueError, IndexError, OverflowError) as err:
+            result_list = []
+            error = str(err)
+
+        # One JSON object per query, or one CSV line per result row
+        if out_format == "json":
+            record = {"query": query_str, "result": result_list}
+            if error is not None:
+                record["error"] = error
+            out_fp.write(json.dumps(record) + "\n")
+        elif error is not None:
+            writer.writerow([query_str, "error", error])
+        else:
+            for row in result_list:
+                writer.writerow([query_str] + row)
 
 
 def display_options():
@@ -244,14 +750,41 @@ def display_options():
     return option
 
 
-def main():
-    print("\nMedian Income Data")
+def main(argv=None):
+
+    # Command line options, no --batch means the interactive menu
+    parser = argparse.ArgumentParser(description="Median Income Data")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run queries from FILE, '-' for stdin")
+    parser.add_argument("--format", choices=["json", "csv"], default="json",
+                        help="batch output format")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="parse data.csv on a pool of this many processes")
+    args = parser.parse_args(argv)
 
     # Call open_file to open an input file for reading
     fp = open_file("r")
 
-    # Call read_file to read the desired data into a “master” list of tuples.
-    master_list = read_file(fp)
+    # Call read_file to read the desired data into a “master” county table.
+    # Parsed tables are cached on disk until data.csv changes
+    if args.workers > 1:
+        master_table = dataCache.cached_read(
+            fp, lambda fp: read_file_parallel(fp.name, args.workers),
+            "financialSorter.read_file")
+    else:
+        master_table = dataCache.cached_read(fp, read_file,
+                                             "financialSorter.read_file")
+
+    # Batch mode, answer every query from the one loaded table
+    if args.batch is not None:
+        if args.batch == "-":
+            run_batch(master_table, sys.stdin, sys.stdout, args.format)
+        else:
+            with open(args.batch, "r") as in_fp:
+                run_batch(master_table, in_fp, sys.stdout, args.format)
+        return
+
+    print("\nMedian Income Data")
 
     # Display menu of options, prompt for input, execute options
     # Loop until the input is "q"
@@ -273,11 +806,13 @@ def main():
                 state = input('Please enter a 2-letter state code: ').upper()
 
                 # Checks for spelling, calls state_average_income
-                if state in STATES:
-                    income = state_average_income(state, master_list)
-                    break
-                else:
-                    print('Please input a valid state')
+                # Territories are known IDs but have no county average
+                if stateIds.is_state(state):
+                    state = stateIds.abbreviation(stateIds.state_id(state))
+                    income = state_average_income(state, master_table)
+                    if income is not None:
+                        break
+                print('Please input a valid state')
 
             # Display income
             print('\nAverage median income in {:2s}: ${:<10,.2f}'
@@ -286,7 +821,7 @@ def main():
         elif option == 2:
 
             # Call top_counties_by_income to determine the top 10
-            display_list = top_counties_by_income(master_list)
+            display_list = top_counties_by_income(master_table)
 
             # Display Header Lines
             print('\nTop 10 Counties by Median Household Income (2018)')
@@ -300,7 +835,7 @@ def main():
         elif option == 3:
 
             # Call bottom_counties_by_income
-            display_list = bottom_counties_by_income(master_list)
+            display_list = bottom_counties_by_income(master_table)
 
             # Display Header Lines
             print('\nBottom 10 Counties by Median Household Income (2018)')
@@ -314,7 +849,7 @@ def main():
         elif option == 4:
 
             # Call top_states_by_income
-            display_list = top_states_by_income(master_list)
+            display_list = top_states_by_income(master_table)
 
             # Display Header Lines
             print('\nTop 10 States by Average Median Household Income (2018)')
@@ -327,7 +862,7 @@ def main():
         elif option == 5:
 
             # Call bottom_states_by_income
-            display_list = bottom_states_by_income(master_list)
+            display_list = bottom_states_by_income(master_table)
 
             # Display Header Lines
             print('\nBottom 10 States by\
@@ -344,14 +879,14 @@ def main():
             while True:
                 state = input('Please enter a 2-letter state code: ').upper()
 
-                if state in STATES:
-                    income = state_average_income(state, master_list)
+                if stateIds.is_state(state):
+                    state = stateIds.abbreviation(stateIds.state_id(state))
                     break
                 else:
                     print('Please input a valid state')
 
             # Find counties in state
-            display_list = counties_in_state(state, master_list)
+            display_list = counties_in_state(state, master_table)
 
             # Display Data
             if len(display_list) > 0:
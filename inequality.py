@@ -0,0 +1,118 @@
+"""
+Income Inequality Metrics
+
+    Bracket_arrays():
+        Get year x bracket count and amount arrays from brackets or a cube
+    Single():
+        Unwrap the year axis for single-year input
+    Lorenz_curve():
+        Cumulative population and income shares at each bracket edge
+    Lorenz_at():
+        Income share held by the bottom q of the population
+    Gini():
+        Gini coefficient from the bracket Lorenz curve
+    Top_share():
+        Income share of the top p of the population
+    Palma_ratio():
+        Top 10% income share over bottom 40% income share
+    Inequality_summary():
+        Gini, top 1% and 10% shares and Palma ratio in one dictionary
+
+Every function takes either one year's master list from
+financialGrapher.read_file (returns floats) or a cube from
+financialGrapher.build_cube (returns one value per year). Incomes are
+taken as spread evenly inside each bracket, so the Gini is the usual
+grouped-data lower bound.
+"""
+
+import numpy as np
+
+
+def bracket_arrays(data):
+    """Get year x bracket count and amount arrays from brackets or a cube"""
+
+    # Cube from build_cube, nan padding counts as empty brackets
+    if isinstance(data, dict):
+        number = np.nan_to_num(np.atleast_2d(data["number"]))
+        amount = np.nan_to_num(np.atleast_2d(data["amount"]))
+        return number, amount, False
+
+    # One year's master list, column 1 is count and column 4 is amount
+    number = np.array([[line[1] for line in data]], dtype=float)
+    amount = np.array([[line[4] for line in data]], dtype=float)
+    return number, amount, True
+
+
+def single(values, is_single):
+    """Unwrap the year axis for single-year input"""
+
+    return float(values[0]) if is_single else values
+
+
+def lorenz_curve(data):
+    """Cumulative population and income shares at each bracket edge"""
+
+    number, amount, is_single = bracket_arrays(data)
+
+    # Start every curve at (0, 0)
+    zero = np.zeros((number.shape[0], 1))
+    pop_share = np.hstack([zero, np.cumsum(number, axis=1)])
+    income_share = np.hstack([zero, np.cumsum(amount, axis=1)])
+    pop_share /= pop_share[:, -1:]
+    income_share /= income_share[:, -1:]
+
+    if is_single:
+        return pop_share[0], income_share[0]
+    return pop_share, income_share
+
+
+def lorenz_at(data, q):
+    """Income share held by the bottom q of the population"""
+
+    pop_share, income_share = lorenz_curve(data)
+    pop_share = np.atleast_2d(pop_share)
+    income_share = np.atleast_2d(income_share)
+    rows = np.arange(pop_share.shape[0])
+
+    # Segment of each curve containing q, then interpolate inside it
+    i = np.sum(pop_share < q, axis=1)
+    i = np.clip(i, 1, pop_share.shape[1] - 1)
+    x0, x1 = pop_share[rows, i - 1], pop_share[rows, i]
+    y0, y1 = income_share[rows, i - 1], income_share[rows, i]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        frac = np.where(x1 > x0, (q - x0)/(x1 - x0), 0.0)
+
+    return single(y0 + frac*(y1 - y0), not isinstance(data, dict))
+
+
+def gini(data):
+    """Gini coefficient from the bracket Lorenz curve"""
+
+    pop_share, income_share = lorenz_curve(data)
+    pop_share = np.atleast_2d(pop_share)
+    income_share = np.atleast_2d(income_share)
+
+    # One minus twice the trapezoid area under the Lorenz curve
+    area = np.sum(np.diff(pop_share, axis=1) *
+                  (income_share[:, 1:] + income_share[:, :-1]), axis=1)/2
+
+    return single(1 - 2*area, not isinstance(data, dict))
+
+
+def top_share(data, p):
+    """Income share of the top p of the population"""
+
+    return 1 - lorenz_at(data, 1 - p)
+
+
+def palma_ratio(data):
+    """Top 10% income share over bottom 40% income share"""
+
+    return top_share(data, 0.10)/lorenz_at(data, 0.40)
+
+
+def inequality_summary(data):
+    """Gini, top 1% and 10% shares and Palma ratio in one dictionary"""
+
+    return {"gini": gini(data), "top_1": top_share(data, 0.01),
+            "top_10": top_share(data, 0.10), "palma": palma_ratio(data)}
@@ -0,0 +1,293 @@
+"""
+Memory-Mapped Dataset File
+
+    Pad_to():
+        Write zero bytes until the file position is a multiple of ALIGN
+    Write_block():
+        Write raw bytes at the next aligned offset, return that offset
+    Array_entry():
+        Write an array's raw bytes, return its directory entry
+    Pack_strings():
+        Encode a list of strings into one UTF-8 pool and byte offsets
+    Export_tables():
+        Write tables of arrays and strings to one fixed-layout file
+    Open_store():
+        Map a dataset file and wrap every column without copying it
+    String_at():
+        Decode one string from a mapped pool
+    String_list():
+        Decode every string of a mapped pool, for short lists
+    County_columns():
+        Exportable columns of a financialSorter county table
+    State_columns():
+        Exportable columns of a regionGrapher state table
+    Open_county_table():
+        County table over a mapped file, usable by financialSorter queries
+    Open_state_table():
+        State table over a mapped file, usable by regionGrapher queries
+    Export_directory():
+        Parse the data files in a directory and export them to one file
+
+    Main():
+        Export a data directory to a dataset file
+
+File layout, all integers little endian:
+    0   8 bytes     magic b"INCDATA\\0"
+    8   uint32      format version
+    12  uint32      reserved, 0
+    16  uint64      directory offset
+    24  uint64      directory length
+    64  ...         column blocks, each starting on a 64-byte boundary
+    directory       UTF-8 JSON, table -> column -> entry
+Array entries hold dtype, shape and offset. String entries hold a UTF-8
+pool and an int64 array of n + 1 byte offsets into it. Opened files are
+mapped read-only, so every process shares the same pages.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import financialGrapher
+import financialSorter
+import regionGrapher
+
+# Constants
+MAGIC = b"INCDATA\0"
+FORMAT_VERSION = 1
+ALIGN = 64
+HEADER = struct.Struct("<8sIIQQ")
+
+COUNTY_ARRAYS = ["state", "income", "fips", "state_offsets", "by_income",
+                 "by_name", "fips_sorted", "fips_rows"]
+STATE_ARRAYS = ["income", "gdp", "pop", "income_pc", "gdp_pc", "state_id"]
+STATE_STRINGS = ["name", "display", "region"]
+
+
+def pad_to(fp):
+    """Write zero bytes until the file position is a multiple of ALIGN"""
+
+    fp.write(b"\0"*(-fp.tell() % ALIGN))
+
+
+def write_block(fp, data):
+    """Write raw bytes at the next aligned offset, return that offset"""
+
+    pad_to(fp)
+    offset = fp.tell()
+    fp.write(data)
+
+    return offset
+
+
+def array_entry(fp, value):
+    """Write an array's raw bytes, return its directory entry"""
+
+    arr = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<"))
+    return {"kind": "array", "dtype": arr.dtype.str, "shape": list(arr.shape),
+            "offset": write_block(fp, arr.tobytes())}
+
+
+def pack_strings(string_list):
+    """Encode a list of strings into one UTF-8 pool and byte offsets"""
+
+    encoded = [s.encode("utf8") for s in string_list]
+    offsets = np.zeros(len(encoded) + 1, dtype="<i8")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    return b"".join(encoded), offsets
+
+
+def export_tables(file_str, table_dict):
+    """Write tables of arrays and strings to one fixed-layout file"""
+
+    directory = {}
+    tmp_str = file_str + ".tmp" + str(os.getpid())
+
+    with open(tmp_str, "wb") as fp:
+        fp.write(b"\0"*ALIGN)
+
+        for table_name, column_dict in table_dict.items():
+            entry_dict = {}
+            for column, value in column_dict.items():
+
+                # Lists of strings go into a pool with byte offsets
+                if isinstance(value, list) and \
+                        all(isinstance(s, str) for s in value):
+                    pool, offsets = pack_strings(value)
+                    entry_dict[column] = {
+                        "kind": "strings", "count": len(value),
+                        "pool": write_block(fp, pool), "size": len(pool),
+                        "offsets": write_block(fp, offsets.tobytes())}
+
+                # Arrays as raw little endian bytes
+                elif isinstance(value, np.ndarray):
+                    entry_dict[column] = array_entry(fp, value)
+
+                # Dictionaries of arrays, one block per key
+                elif isinstance(value, dict) and \
+                        all(isinstance(v, np.ndarray) for v in value.values()):
+                    entry_dict[column] = {
+                        "kind": "array_dict",
+                        "keys": {key: array_entry(fp, v)
+                                 for key, v in value.items()}}
+
+                # Anything small and plain rides along in the directory
+                else:
+                    entry_dict[column] = {"kind": "json", "value": value}
+
+            directory[table_name] = entry_dict
+
+        # Directory last, then the header that points at it
+        dir_bytes = json.dumps(directory).encode("utf8")
+        dir_offset = write_block(fp, dir_bytes)
+        fp.seek(0)
+        fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, dir_offset,
+                             len(dir_bytes)))
+
+    os.replace(tmp_str, file_str)
+
+
+def open_store(file_str):
+    """Map a dataset file and wrap every column without copying it"""
+
+    with open(file_str, "rb") as fp:
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, reserved, dir_offset, dir_length = HEADER.unpack_from(mm)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("Not a version {} dataset file: {}".format(
+            FORMAT_VERSION, file_str))
+    directory = json.loads(mm[dir_offset:dir_offset + dir_length])
+
+    # Views into the mapping, nothing is copied until a value is read
+    def array_view(entry):
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        return np.frombuffer(mm, dtype, count,
+                             entry["offset"]).reshape(entry["shape"])
+
+    view = memoryview(mm)
+    store = {"mmap": mm, "tables": {}}
+    for table_name, entry_dict in directory.items():
+        table = {}
+        for column, entry in entry_dict.items():
+            if entry["kind"] == "array":
+                table[column] = array_view(entry)
+            elif entry["kind"] == "strings":
+                table[column] = {
+                    "pool": view[entry["pool"]:entry["pool"] + entry["size"]],
+                    "offsets": np.frombuffer(mm, "<i8", entry["count"] + 1,
+                                             entry["offsets"])}
+            elif entry["kind"] == "array_dict":
+                table[column] = {key: array_view(e)
+                                 for key, e in entry["keys"].items()}
+            else:
+                table[column] = entry["value"]
+        store["tables"][table_name] = table
+
+    return store
+
+
+def string_at(strings, i):
+    """Decode one string from a mapped pool"""
+
+    offsets = strings["offsets"]
+    return bytes(strings["pool"][offsets[i]:offsets[i + 1]]).decode("utf8")
+
+
+def string_list(strings):
+    """Decode every string of a mapped pool, for short lists"""
+
+    return [string_at(strings, i) for i in range(len(strings["offsets"]) - 1)]
+
+
+def county_columns(master_table):
+    """Exportable columns of a financialSorter county table"""
+
+    column_dict = {name: master_table[name] for name in COUNTY_ARRAYS}
+    column_dict["state_names"] = list(master_table["state_names"])
+    column_dict["county"] = [
+        financialSorter.county_name(master_table, row)
+        for row in range(len(master_table["income"]))]
+
+    return column_dict
+
+
+def state_columns(state_table):
+    """Exportable columns of a regionGrapher state table"""
+
+    column_dict = {name: state_table[name]
+                   for name in STATE_ARRAYS + STATE_STRINGS}
+    column_dict["region_index"] = state_table["region_index"]
+    column_dict["missing"] = state_table.get("missing", {})
+
+    return column_dict
+
+
+def open_county_table(store):
+    """County table over a mapped file, usable by financialSorter queries"""
+
+    mapped = store["tables"]["county"]
+    master_table = {name: mapped[name] for name in COUNTY_ARRAYS}
+
+    # State codes are a short list, county names stay in the mapped pool
+    master_table["state_names"] = string_list(mapped["state_names"])
+    master_table["county_pool"] = mapped["county"]["pool"]
+    master_table["county_offsets"] = mapped["county"]["offsets"]
+
+    return master_table
+
+
+def open_state_table(store):
+    """State table over a mapped file, usable by regionGrapher queries"""
+
+    mapped = store["tables"]["state"]
+    state_table = {name: mapped[name] for name in STATE_ARRAYS}
+
+    # One row per state, decoding the names is cheap
+    for name in STATE_STRINGS:
+        state_table[name] = string_list(mapped[name])
+    state_table["region_index"] = dict(mapped["region_index"])
+    state_table["missing"] = mapped["missing"]
+
+    return state_table
+
+
+def export_directory(file_str, directory=".", workers=None):
+    """Parse the data files in a directory and export them to one file"""
+
+    table_dict = {
+        "county": county_columns(financialSorter.load_county_table(directory)),
+        "state": state_columns(regionGrapher.load_state_table(directory))}
+
+    # Year brackets as one year x bracket cube
+    year_dict = financialGrapher.load_years(directory, workers)
+    if len(year_dict) > 0:
+        table_dict["years"] = financialGrapher.build_cube(year_dict)
+
+    export_tables(file_str, table_dict)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export a dataset file")
+    parser.add_argument("out_file", help="dataset file to write")
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    export_directory(args.out_file, args.data_dir, args.workers)
+
+    # Report what went in
+    store = open_store(args.out_file)
+    for table_name, table in store["tables"].items():
+        print("{}: {}".format(table_name, ", ".join(table)))
+
+
+if __name__ == '__main__':
+    main()
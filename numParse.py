@@ -0,0 +1,113 @@
+"""
+Numeric Field Parser
+
+    Clean_number():
+        Strip whitespace and thousands separators from one cell
+    Plain_number():
+        Check a converted cell: ASCII digits only, no "_", finite
+    Parse_number():
+        Convert one cell to an int or float, default if missing or bad
+    Parse_column():
+        Convert a whole column of cells to an int or float array
+    Column_to_list():
+        Turn a parsed column back into Python numbers, None where invalid
+
+Cells like "1,234" or " 2,100.95 " are valid, "" is missing, anything
+else (e.g. "—", "and", "over", "nan", "1_000") is bad. Missing and bad
+cells are kept apart so readers can skip the first and report the
+second. Cells are converted with int()/float() first, then the few
+spellings those accept beyond plain numbers are sent to the bad list.
+"""
+
+import math
+
+import numpy as np
+
+# Constants
+CONVERT_DICT = {"int": int, "float": float}
+DTYPE_DICT = {"int": np.int64, "float": np.float64}
+
+
+def clean_number(s):
+    """Strip whitespace and thousands separators from one cell"""
+
+    return s.replace(",", "").strip()
+
+
+def plain_number(s, value):
+    """Check a converted cell: ASCII digits only, no "_", finite"""
+
+    # int() and float() also take "1_000", other scripts' digits and
+    # "nan" or "inf", none of which are numbers in these files
+    return s.isascii() and "_" not in s and math.isfinite(value)
+
+
+def parse_number(s, T="int", default=None):
+    """Convert one cell to an int or float, default if missing or bad"""
+
+    # int() and float() skip surrounding whitespace themselves
+    try:
+        value = CONVERT_DICT[T](s.replace(",", ""))
+    except ValueError:
+        return default
+
+    return value if plain_number(s, value) else default
+
+
+def parse_column(cells, T="int", name=None):
+    """Convert a whole column of cells to an int or float array
+
+    Returns (values, valid, bad_list): values is an int64 or float64
+    array with 0 (int) or nan (float) where a cell is missing or bad,
+    valid marks the parsed cells and bad_list holds (row, text) for
+    every cell that is neither a number nor empty. When name is given,
+    bad cells raise a ValueError naming the column instead.
+    """
+
+    convert = CONVERT_DICT[T]
+    dtype = DTYPE_DICT[T]
+
+    # Common case, every cell is a plain number. Check and clean the whole
+    # column as one string, a cell holding a newline splits differently
+    text = "\n".join(cells)
+    format_list = text.replace(",", "").split("\n")
+    if len(format_list) == len(cells) and text.isascii() and \
+            "_" not in text:
+        try:
+            values = np.fromiter(map(convert, format_list), dtype=dtype,
+                                 count=len(format_list))
+            if np.isfinite(values).all():
+                return values, np.ones(len(values), dtype=bool), []
+        except (ValueError, OverflowError):
+            pass
+
+    # Otherwise convert cell by cell, failures are missing or bad
+    values = np.full(len(cells), np.nan if T == "float" else 0, dtype=dtype)
+    valid = np.zeros(len(cells), dtype=bool)
+    bad_list = []
+    for i, s in enumerate(cells):
+        format_str = clean_number(s)
+        try:
+            value = convert(format_str)
+            if plain_number(format_str, value):
+                values[i] = value
+                valid[i] = True
+                continue
+        except (ValueError, OverflowError):
+            pass
+        if format_str != "":
+            bad_list.append((i, s))
+
+    if name is not None and len(bad_list) > 0:
+        raise ValueError("bad {} cells in {}: {}".format(
+            T, name, ", ".join("row {} {!r}".format(i, text)
+                               for i, text in bad_list[:10])))
+
+    return values, valid, bad_list
+
+
+def column_to_list(values, valid):
+    """Turn a parsed column back into Python numbers, None where invalid"""
+
+    return [v if ok else None
+            for v, ok in zip(values.tolist(), valid.tolist())]
@@ -0,0 +1,115 @@
+"""
+Rendered Plot Cache
+
+    Plot_key():
+        Hash plotted arrays, labels, style and output format
+    Entry_path():
+        Cache file for a plot key
+    Fetch():
+        Copy a cached render to file_str, False on a miss
+    Store():
+        Copy a fresh render into the cache, then evict down to size
+    Evict():
+        Delete least recently used entries until the cache fits
+
+Entries are named by the hash of everything that changes the picture, so
+a hit is a file copy. Hits bump the entry's mtime, eviction removes the
+oldest mtimes first.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+import dataCache
+
+# Constants
+PLOT_CACHE_DIR = os.environ.get("INCOME_PLOT_CACHE_DIR",
+                                os.path.join(dataCache.CACHE_DIR, "plots"))
+PLOT_CACHE_BYTES = int(os.environ.get("INCOME_PLOT_CACHE_BYTES", 256 << 20))
+
+
+def plot_key(arrays, labels, style, fmt):
+    """Hash plotted arrays, labels, style and output format"""
+
+    digest = hashlib.sha256()
+
+    # Arrays by dtype, shape and raw bytes
+    for values in arrays:
+        arr = np.ascontiguousarray(values)
+        digest.update("{}{}".format(arr.dtype.str, arr.shape).encode("utf8"))
+        digest.update(arr.tobytes())
+
+    # Labels, style and format as canonical JSON
+    digest.update(json.dumps([labels, style, fmt], sort_keys=True,
+                             default=str).encode("utf8"))
+
+    return digest.hexdigest()
+
+
+def entry_path(key, fmt, cache_dir=None):
+    """Cache file for a plot key"""
+
+    return os.path.join(cache_dir or PLOT_CACHE_DIR, key + "." + fmt)
+
+
+def fetch(key, file_str, cache_dir=None):
+    """Copy a cached render to file_str, False on a miss"""
+
+    fmt = os.path.splitext(file_str)[1].lstrip(".") or "png"
+    cache_str = entry_path(key, fmt, cache_dir)
+
+    try:
+        # Mark as recently used, then hand out the stored file
+        os.utime(cache_str)
+        shutil.copyfile(cache_str, file_str)
+    except OSError:
+        return False
+
+    return True
+
+
+def store(key, file_str, cache_dir=None, max_bytes=None):
+    """Copy a fresh render into the cache, then evict down to size"""
+
+    fmt = os.path.splitext(file_str)[1].lstrip(".") or "png"
+    cache_str = entry_path(key, fmt, cache_dir)
+
+    # Atomic replace so readers never see a half-copied file
+    try:
+        os.makedirs(os.path.dirname(cache_str), exist_ok=True)
+        tmp_str = cache_str + ".tmp" + str(os.getpid())
+        shutil.copyfile(file_str, tmp_str)
+        os.replace(tmp_str, cache_str)
+    except OSError:
+        return
+
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=None, max_bytes=None):
+    """Delete least recently used entries until the cache fits"""
+
+    cache_dir = cache_dir or PLOT_CACHE_DIR
+    max_bytes = PLOT_CACHE_BYTES if max_bytes is None else max_bytes
+
+    # (mtime, size, path) for every finished entry
+    entry_list = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and ".tmp" not in entry.name:
+            stat = entry.stat()
+            entry_list.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    # Oldest first until the rest fits
+    total = sum(e[1] for e in entry_list)
+    for mtime, size, path in sorted(entry_list):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            continue
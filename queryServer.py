@@ -0,0 +1,341 @@
+"""
+Income Data Query Server
+
+    Load_datasets():
+        Load county, year bracket and region data once, through the cache
+    Handle_request():
+        Route a GET path to the query functions, return status and body
+    Grapher_request():
+        Answer a /grapher/<year>/... request from one year's brackets
+    Cube_request():
+        Answer a /grapher/<year>/... request from a mapped bracket cube
+    Finite_arg():
+        Convert a path word to a float, ValueError unless it is finite
+    Region_request():
+        Answer a /region/<region> request
+    Route_key():
+        Name the endpoint a path matched, for latency metrics
+    Record_latency():
+        Add one request's latency to the per-route metrics
+    Latency_summary():
+        Count, mean, p50, p99 and max latency in ms for each route
+    Handle_client():
+        Serve HTTP/1.1 requests on one connection until it closes
+    Start_server():
+        Start the asyncio server on host and port
+
+    Main():
+        Load datasets, serve until interrupted
+
+Endpoints, all GET, all answering JSON:
+    /sorter/<query>/<args...>       financialSorter batch query,
+                                    e.g. /sorter/top_counties/25/TX
+    /grapher/<year>/average         average income for a year file
+    /grapher/<year>/median          median income for a year file
+    /grapher/<year>/range/<pct>     income bracket at a percent
+    /grapher/<year>/percent/<inc>   cumulative percent at an income
+    /region/<region>                min/max and state rows for a region
+    /metrics                        request latency per route
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from urllib.parse import unquote
+
+import numpy as np
+
+import financialGrapher
+import financialSorter
+import mappedData
+import regionGrapher
+
+# Constants
+LATENCY_SAMPLES = 10000
+GRAPHER_OPS = ["average", "median", "range", "percent"]
+MAX_HEADER_LINES = 100
+
+
+def load_datasets(directory=".", mapped_str=None):
+    """Load county, year bracket and region data once, through the cache"""
+
+    datasets = {"metrics": {}}
+
+    # Every table from a shared dataset file, if given, years as one cube
+    if mapped_str is not None:
+        store = mappedData.open_store(mapped_str)
+        datasets["county"] = mappedData.open_county_table(store)
+        datasets["region"] = mappedData.open_state_table(store)
+        datasets["cube"] = store["tables"].get("years")
+        return datasets
+
+    datasets["county"] = financialSorter.load_county_table(directory)
+    datasets["region"] = regionGrapher.load_state_table(directory)
+
+    # Every yearXXXX.txt bracket file, keyed by year, read concurrently
+    datasets["years"] = financialGrapher.load_years(directory)
+
+    return datasets
+
+
+def handle_request(datasets, path):
+    """Route a GET path to the query functions, return status and body"""
+
+    # Split the path, ignore any query string
+    word_list = [unquote(w) for w in path.split("?")[0].split("/") if w]
+    if len(word_list) == 0:
+        return 404, {"error": "not found"}
+
+    try:
+        if word_list[0] == "sorter" and len(word_list) > 1:
+            rows = financialSorter.run_query(" ".join(word_list[1:]),
+                                             datasets["county"])
+            return 200, {"result": [list(row) for row in rows]}
+
+        elif word_list[0] == "grapher" and len(word_list) > 2 and \
+                "cube" in datasets:
+            return cube_request(datasets["cube"], int(word_list[1]),
+                                word_list[2:])
+
+        elif word_list[0] == "grapher" and len(word_list) > 2:
+            master_list = datasets["years"].get(int(word_list[1]))
+            if master_list is None:
+                return 404, {"error": "no data for year " + word_list[1]}
+            return grapher_request(master_list, word_list[2:])
+
+        elif word_list[0] == "region" and len(word_list) == 2:
+            return region_request(datasets["region"], word_list[1])
+
+        elif word_list[0] == "metrics":
+            return 200, latency_summary(datasets["metrics"])
+
+    except (ValueError, IndexError, TypeError) as err:
+        return 400, {"error": str(err)}
+
+    # Anything else is our fault, answer it rather than drop the connection
+    except Exception as err:
+        return 500, {"error": "internal error: " + repr(err)}
+
+    return 404, {"error": "not found"}
+
+
+def grapher_request(master_list, word_list):
+    """Answer a /grapher/<year>/... request from one year's brackets"""
+
+    if word_list[0] == "average":
+        return 200, {"result": financialGrapher.find_average(master_list)}
+    elif word_list[0] == "median":
+        return 200, {"result": financialGrapher.find_median(master_list)}
+    elif word_list[0] == "range":
+        found = financialGrapher.get_range(master_list,
+                                         finite_arg(word_list[1]))
+    elif word_list[0] == "percent":
+        found = financialGrapher.get_percent(master_list,
+                                           finite_arg(word_list[1]))
+    else:
+        return 404, {"error": "not found"}
+
+    if found is None:
+        return 404, {"error": "out of range"}
+    return 200, {"result": list(found)}
+
+
+def cube_request(cube, year, word_list):
+    """Answer a /grapher/<year>/... request from a mapped bracket cube"""
+
+    # Row of the year in the cube
+    row_list = [] if cube is None else \
+        np.flatnonzero(cube["years"] == year).tolist()
+    if len(row_list) == 0:
+        return 404, {"error": "no data for year " + str(year)}
+    row = row_list[0]
+
+    if word_list[0] == "average":
+        average = financialGrapher.cube_average(cube)[row]
+        return 200, {"result": float(average)}
+    elif word_list[0] == "median":
+        median = financialGrapher.cube_median(cube)[row]
+        return 200, {"result": None if np.isnan(median) else float(median)}
+    elif word_list[0] == "range":
+        found = financialGrapher.cube_range(cube, row,
+                                          finite_arg(word_list[1]))
+    elif word_list[0] == "percent":
+        found = financialGrapher.cube_percent(cube, row,
+                                            finite_arg(word_list[1]))
+    else:
+        return 404, {"error": "not found"}
+
+    if found is None:
+        return 404, {"error": "out of range"}
+    return 200, {"result": list(found)}
+
+
+def finite_arg(word):
+    """Convert a path word to a float, ValueError unless it is finite"""
+
+    # "nan" and "inf" parse as floats but sit in no bracket
+    value = float(word)
+    if not np.isfinite(value):
+        raise ValueError("not a finite number: " + word)
+
+    return value
+
+
+def region_request(state_table, region):
+    """Answer a /region/<region> request"""
+
+    if region not in regionGrapher.REGION_LIST:
+        return 404, {"error": "unknown region " + region}
+
+    summary = regionGrapher.region_summary(state_table, region)
+    min_income, max_income, min_gdp, max_gdp = summary["min_max"]
+
+    return 200, {"min_income": min_income, "max_income": max_income,
+                 "min_gdp": min_gdp, "max_gdp": max_gdp,
+                 "states": summary["states"]}
+
+
+def route_key(path):
+    """Name the endpoint a path matched, for latency metrics"""
+
+    # A fixed set of keys, so arbitrary paths cannot grow the metrics
+    word_list = [unquote(w) for w in path.split("?")[0].split("/") if w]
+    if len(word_list) > 1 and word_list[0] == "sorter" and \
+            word_list[1].lower() in financialSorter.QUERY_NAMES:
+        return "sorter/" + word_list[1].lower()
+    elif len(word_list) > 2 and word_list[0] == "grapher" and \
+            word_list[2] in GRAPHER_OPS:
+        return "grapher/" + word_list[2]
+    elif len(word_list) == 2 and word_list[0] == "region":
+        return "region"
+    elif len(word_list) > 0 and word_list[0] == "metrics":
+        return "metrics"
+
+    return "not_found"
+
+
+def record_latency(metrics, route, seconds):
+    """Add one request's latency to the per-route metrics"""
+
+    # Bounded sample window per route, plus an all-time count
+    if route not in metrics:
+        metrics[route] = {"count": 0,
+                          "samples": deque(maxlen=LATENCY_SAMPLES)}
+    entry = metrics[route]
+    entry["count"] += 1
+    entry["samples"].append(seconds*1000)
+
+
+def latency_summary(metrics):
+    """Count, mean, p50, p99 and max latency in ms for each route"""
+
+    summary = {}
+    for route, entry in metrics.items():
+        samples = np.array(entry["samples"])
+        p50, p99 = np.percentile(samples, [50, 99])
+        summary[route] = {"count": entry["count"],
+                          "mean_ms": round(float(samples.mean()), 3),
+                          "p50_ms": round(float(p50), 3),
+                          "p99_ms": round(float(p99), 3),
+                          "max_ms": round(float(samples.max()), 3)}
+
+    return summary
+
+
+async def handle_client(datasets, reader, writer):
+    """Serve HTTP/1.1 requests on one connection until it closes"""
+
+    try:
+        while True:
+            # Request line, e.g. "GET /metrics HTTP/1.1"
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            start = time.perf_counter()
+            word_list = request_line.decode("latin-1").split()
+
+            # Headers, only Connection matters here
+            keep_alive = len(word_list) == 3 and word_list[2] == "HTTP/1.1"
+            for i in range(MAX_HEADER_LINES):
+                header = (await reader.readline()).decode("latin-1").strip()
+                if header == "":
+                    break
+                name, _, value = header.partition(":")
+                if name.strip().lower() == "connection":
+                    keep_alive = value.strip().lower() == "keep-alive"
+
+            # Answer the request
+            if len(word_list) < 2:
+                status, body = 400, {"error": "bad request"}
+                route = "bad"
+            elif word_list[0] != "GET":
+                status, body = 405, {"error": "only GET is supported"}
+                route = "bad"
+            else:
+                status, body = handle_request(datasets, word_list[1])
+                route = route_key(word_list[1])
+
+            payload = json.dumps(body).encode("utf8")
+            writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+                         "Content-Length: {}\r\nConnection: {}\r\n\r\n".format(
+                             status, "OK" if status == 200 else "Error",
+                             len(payload),
+                             "keep-alive" if keep_alive else "close")
+                         .encode("latin-1") + payload)
+            await writer.drain()
+            record_latency(datasets["metrics"], route,
+                           time.perf_counter() - start)
+
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(datasets, host="127.0.0.1", port=8080):
+    """Start the asyncio server on host and port"""
+
+    return await asyncio.start_server(
+        lambda reader, writer: handle_client(datasets, reader, writer),
+        host, port)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Income data query server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data-dir", default=".")
+    parser.add_argument("--mapped", metavar="FILE",
+                        help="serve every table from a mappedData file")
+    args = parser.parse_args()
+
+    # Load every dataset once, then serve from memory
+    datasets = load_datasets(args.data_dir, args.mapped)
+    if "cube" in datasets:
+        year_list = [] if datasets["cube"] is None else \
+            datasets["cube"]["years"].tolist()
+    else:
+        year_list = sorted(datasets["years"])
+    print("Loaded {} counties, years {}, {} states".format(
+        len(datasets["county"]["income"]), year_list,
+        len(datasets["region"]["name"])))
+
+    async def serve():
+        server = await start_server(datasets, args.host, args.port)
+        print("Serving on http://{}:{}".format(args.host, args.port))
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
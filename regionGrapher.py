@@ -5,18 +5,63 @@ Region Economic Analysis
         Take a file type string and prompt until name is correct, open file
     Read_income_file()
         Build a dictionary from income file
+    Parse_gdp_file()
+        Read the GDP file into a dictionary of state -> GDP
+    Parse_pop_file()
+        Read the population file into a dictionary of state -> millions
     Read_gdp_file()
         Find and append GDP data onto state lists within dictionary
     Read_pop_file()
         Find and append population data onto state lists within dictionary
-
+    Parse_file()
+        Open and parse one source file on its own, for pool workers
+    Join_state_data()
+        Join the three parsed sources by state name, report missing ones
+    Read_sources()
+        Parse the three files concurrently, then join them by state
+
+    Read_series_file()
+        Read a BEA quarterly table into state x quarter arrays
+    Read_income_series()
+        Read every quarter, percent change and rank from the income file
+    Read_gdp_series()
+        Read every quarter and percent of the U.S. from the GDP file
+    Series_growth()
+        Quarter-over-quarter percent change for every state at once
+    Per_capita_series()
+        Dollars per person for every state and quarter
+    Region_rollup()
+        Sum state series into one row per region
+
+    Build_state_table()
+        Build named columns and a region index from the state dictionary
+    Per_capita_columns()
+        Recompute income and GDP per capita from the table's columns
+    Update_state_columns()
+        Replace one source's columns in place, None if rows must be rebuilt
+    Load_state_table()
+        Read the three files from a directory into a cached state table
+
+    Region_rows()
+        Find the table rows of a region, None if the region is invalid
     Get_min_max()
-        Extract data for specified region (str) from the dictionary D
+        Extract data for specified region (str) from the state table
     Get_region_states()
         Build list of tuples for state data in the specified region
 
+    Region_summary()
+        Region's state list and min/max income and GDP, computed once
+    Invalidate_summaries()
+        Drop cached region summaries after the table's columns change
+
+    Format_region()
+        Build the display_region text for a region, None if invalid
     Display_region()
         Display min & max income and GDP; regions’ state data
+    Metric_matrix()
+        Stack the five plot metrics into a metric x state array
+    Region_regressions()
+        Correlation and y-on-x fits for every metric pair and region
     Plot_regression()
         Plots the regression line between 2 variables
     Plot()
@@ -24,7 +69,7 @@ Region Economic Analysis
 
     Main()
         Opens income, GPD, population files
-        Extracts data from each in a dictionary
+        Extracts data from each into a state table
         Prompts user for region
         Displays region data
         Prompts user for plotting
@@ -34,23 +79,31 @@ Region Economic Analysis
 
 
 import csv
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+import numpy as np
 import pylab
-from operator import itemgetter
+
+import dataCache
+import numParse
+import plotCache
+import stateIds
 
 REGION_LIST = ['Far West', 'Great Lakes', 'Mideast', 'New England', 'Plains',
                'Rocky Mountain', 'Southeast', 'Southwest', 'all']
+REGION_SET = frozenset(REGION_LIST)
+
+# Full state names, alphabetical
+STATES = sorted(stateIds.NAMES[:stateIds.N_STATES])
 
-STATES = ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado',
-          'Connecticut', 'Delaware', 'District of Columbia', 'Florida',
-          'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa',
-          'Kansas', 'Kentucky', 'Louisiana', 'Maine', 'Maryland',
-          'Massachusetts', 'Michigan', 'Minnesota', 'Mississippi', 'Missouri',
-          'Montana', 'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey',
-          'New Mexico', 'New York', 'North Carolina', 'North Dakota', 'Ohio',
-          'Oklahoma', 'Oregon', 'Pennsylvania', 'Rhode Island',
-          'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah',
-          'Vermont', 'Virginia', 'Washington', 'West Virginia', 'Wisconsin',
-          'Wyoming']
+VALUES_LIST = ['Pop', 'GDP', 'PI', 'GDPp', 'PIp']
+VALUES_NAMES = ['Population(m)', 'GDP(m)', 'Income(m)', 'GDP per capita',
+                'Income per capita']
+
+QUARTER_PATTERN = re.compile(r"Q[1-4]")
 
 PROMPT1 = "\nSpecify a region from this list or 'q' to quit -- \nFar West,\
 Great Lakes, Mideast, New England, Plains,\
@@ -84,32 +137,38 @@ def read_income_file(fp):
     reader = csv.reader(fp)
     master_dict = {}
     region = ""
-    state = ""
-    income = 0
+    state_list = []
+    cell_list = []
 
-    # Extract region name, state name, and income for the state
+    # Extract region name, state name, and income cell for the state
     for line_list in reader:
         # Region, state names, index 0, either a region or state
-        if line_list[0].strip() in REGION_LIST:
+        if line_list[0].strip() in REGION_SET:
             region = line_list[0].strip()
             continue
-        else:
-            state = line_list[0].strip()
 
-        # Income is at index 6, remove the comma, convert to an int
-        format_list = line_list[6].split(",")
-        income = int("".join(format_list))
+        # Any spelling of a state becomes its full name
+        state_list.append((stateIds.canonical_name(line_list[0].strip()),
+                           region))
+        cell_list.append(line_list[6])
 
-        # Use state as a dictionary key, put region and income into list
-        state_list = [region, income]
-        master_dict[state] = state_list
+    # Income is at index 6, convert the whole column to ints
+    income_arr, valid, bad_list = numParse.parse_column(
+        cell_list, "int", "income column 6")
+
+    # Use state as a dictionary key, put region and income into list.
+    # Empty cells drop the state, join_state_data reports it as missing
+    for (state, region), income, ok in zip(state_list, income_arr.tolist(),
+                                           valid.tolist()):
+        if ok:
+            master_dict[state] = [region, income]
 
     # Return dictionary with key=state and value=[region,income]
     return master_dict
 
 
-def read_gdp_file(fp, master_dict):
-    '''Find and append GDP data onto state lists within dictionary'''
+def parse_gdp_file(fp):
+    '''Read the GDP file into a dictionary of state -> GDP'''
 
     # Skip first 6 lines
     for i in range(7):
@@ -117,187 +176,538 @@ def read_gdp_file(fp, master_dict):
 
     # Loop variables
     reader = csv.reader(fp)
-    state = ""
-    GDP = 0
+    state_list = []
+    cell_list = []
 
-    # Extract state name (index 0) and GDP for the state (index 7)
+    # Extract state name (index 0) and GDP cell for the state (index 7)
     for line_list in reader:
         # Region, state names, index 0, either a region or state
-        if line_list[0].strip() in STATES:
-            state = line_list[0].strip()
-        else:
-            continue
+        if stateIds.is_state(line_list[0]):
+            state_list.append(stateIds.canonical_name(line_list[0].strip()))
+            cell_list.append(line_list[7])
 
-        # GDP is at index 7, remove the comma, convert to an int
-        format_list = line_list[7].split(",")
-        GDP = int("".join(format_list))
+    # GDP is at index 7, convert the whole column to ints
+    GDP_arr, valid, bad_list = numParse.parse_column(
+        cell_list, "int", "GDP column 7")
 
-        # Use state as a dictionary key, put GDP into list
-        state_list = master_dict[state]
-        state_list.append(GDP)
-        master_dict[state] = state_list
+    # Return dictionary with key=state and value=GDP, empty cells dropped
+    return {state: gdp for state, gdp, ok in
+            zip(state_list, GDP_arr.tolist(), valid.tolist()) if ok}
 
-    # Return dictionary with key=state and value=[region,income,GDP]
-    return master_dict
 
-
-def read_pop_file(fp, master_dict):
-    '''Find and append population data onto state lists within dictionary'''
+def parse_pop_file(fp):
+    '''Read the population file into a dictionary of state -> millions'''
 
     # Skip 1 header line
     fp.readline()
 
     # Loop variables
     reader = csv.reader(fp)
-    state = ""
-    population = 0
+    state_list = []
+    cell_list = []
 
-    # Extract state population from file, attach to each state tuple
+    # Extract state name (index 1) and population (index 2), no regions
     for line_list in reader:
-        # Extract state name (index 1), no regions to skip
-        state = line_list[1].strip()
+        state_list.append(stateIds.canonical_name(line_list[1].strip()))
+        cell_list.append(line_list[2])
 
-        # Extract population for the state (index 2)
-        population = int(line_list[2])
-        # Convert population to millions, round to 2 decimal points
-        population = round(population/10**6, 2)
+    # Convert population to millions, round to 2 decimal points
+    pop_arr, valid, bad_list = numParse.parse_column(
+        cell_list, "int", "population column 2")
+    pop_list = [round(p/10**6, 2) for p in pop_arr.tolist()]
 
-        # Use state as key to dictionary, append population value list
-        try:
-            state_list = master_dict[state]
-            state_list.append(population)
-            master_dict[state] = state_list
-        except KeyError:
-            # If state isn't in master_list => it's a region, ignore it
-            continue
+    # Return dictionary with key=state and value=population, empty cells
+    # dropped
+    return {state: pop for state, pop, ok in
+            zip(state_list, pop_list, valid.tolist()) if ok}
+
+
+def read_gdp_file(fp, master_dict):
+    '''Find and append GDP data onto state lists within dictionary'''
+
+    # Use state as a dictionary key, put GDP into list
+    for state, GDP in parse_gdp_file(fp).items():
+        master_dict[state].append(GDP)
+
+    # Return dictionary with key=state and value=[region,income,GDP]
+    return master_dict
+
+
+def read_pop_file(fp, master_dict):
+    '''Find and append population data onto state lists within dictionary'''
+
+    # Use state as key to dictionary, append population value list
+    for state, population in parse_pop_file(fp).items():
+        # If state isn't in master_dict => it's a region, ignore it
+        if state in master_dict:
+            master_dict[state].append(population)
 
     # Return dictionary with key=state and value=[region,income,GDP,population]
     return master_dict
 
 
-def get_min_max(master_dict, region):
-    '''Extract data for the specified region (str) from the dictionary D'''
+def parse_file(kind, file_str):
+    '''Open and parse one source file on its own, for pool workers'''
 
-    # Call to get_region_states to get narrow down states
-    region_list = get_region_states(master_dict, region)
-    # If it returns none the region was invalid
-    if region_list == None:
-        return None
+    parser_dict = {"income": read_income_file, "gdp": parse_gdp_file,
+                   "pop": parse_pop_file}
+    with open(file_str, "r") as fp:
+        return parser_dict[kind](fp)
 
-    # Sort list by income, select first and last values with itemgetter
-    income_list = sorted(region_list, key=itemgetter(-1), reverse=True)
 
-    # Select the first and last states to get the min and max income and gdp
-    if income_list[0][0] == "DC":
-        # Switches DC to full name for beginning max state display
-        max_income_state = "District of Columbia", income_list[0][-1],\
-            income_list[0][-2]
-    else:
-        max_income_state = income_list[0][0], income_list[0][-1],\
-            income_list[0][-2]
+def join_state_data(income_dict, gdp_dict, pop_dict):
+    '''Join the three parsed sources by state name, report missing ones'''
+
+    # States in income file order, kept only when every source has them
+    master_dict = {}
+    for state, (region, income) in income_dict.items():
+        if state in gdp_dict and state in pop_dict:
+            master_dict[state] = [region, income, gdp_dict[state],
+                                  pop_dict[state]]
+
+    # Any name seen in one source but absent from another
+    source_dict = {"income": income_dict, "gdp": gdp_dict, "pop": pop_dict}
+    name_list = list(dict.fromkeys(list(income_dict) + list(gdp_dict) +
+                                   list(pop_dict)))
+    missing = {kind: [name for name in name_list if name not in source]
+               for kind, source in source_dict.items()}
+
+    # Return dictionary with key=state and value=[region,income,GDP,population]
+    return master_dict, missing
+
+
+def read_sources(income_str, gdp_str, pop_str, executor_class=None):
+    '''Parse the three files concurrently, then join them by state'''
+
+    # Threads by default, pass ProcessPoolExecutor for CPU-bound inputs
+    executor_class = executor_class or ThreadPoolExecutor
+    with executor_class(max_workers=3) as pool:
+        income_job = pool.submit(parse_file, "income", income_str)
+        gdp_job = pool.submit(parse_file, "gdp", gdp_str)
+        pop_job = pool.submit(parse_file, "pop", pop_str)
+
+        return join_state_data(income_job.result(), gdp_job.result(),
+                               pop_job.result())
+
+
+def read_series_file(fp):
+    '''Read a BEA quarterly table into state x quarter arrays'''
+
+    row_list = list(csv.reader(fp))
+
+    # Quarter row is the first header row with a quarter in column 1,
+    # the row above it holds the years
+    head = next(i for i, row in enumerate(row_list)
+                if len(row) > 1 and QUARTER_PATTERN.match(row[1].strip()))
+    year_row, quarter_row = row_list[head - 1], row_list[head]
+
+    # Leading level columns: carry the year forward, stop at a repeat
+    label_list = []
+    year = ""
+    for col in range(1, len(quarter_row)):
+        cell = year_row[col].strip() if col < len(year_row) else ""
+        if cell != "":
+            year = cell if cell.isdigit() else ""
+        quarter = QUARTER_PATTERN.match(quarter_row[col].strip())
+        label = "{}:{}".format(year, quarter.group(0)) if year and quarter \
+            else None
+        if label is None or label in label_list:
+            break
+        label_list.append(label)
+    n_quarters = len(label_list)
+
+    # State rows only, regions set the region for the states below them
+    region = ""
+    state_list = []
+    region_list = []
+    cell_list = []
+    for row in row_list[head + 1:]:
+        name = row[0].strip() if len(row) > 0 else ""
+        if name in REGION_SET:
+            region = name
+        elif stateIds.is_state(name):
+            state_list.append(stateIds.canonical_name(name))
+            region_list.append(region)
+            cell_list.append(row[1:len(quarter_row)])
+
+    # Parse every cell at once, levels are whole numbers
+    n_cols = len(quarter_row) - 1
+    flat = [c for cells in cell_list
+            for c in (cells + [""]*n_cols)[:n_cols]]
+    levels = [c for i, c in enumerate(flat) if i % n_cols < n_quarters]
+    values, valid, bad_list = numParse.parse_column(
+        levels, "int", "quarterly levels")
+
+    # Empty quarters become nan instead of a level of 0
+    if not valid.all():
+        values = values.astype(float)
+        values[~valid] = np.nan
+    extra, valid, bad_list = numParse.parse_column(
+        [c for i, c in enumerate(flat) if i % n_cols >= n_quarters], "float")
+
+    # Headers of the columns after the levels
+    extra_labels = [" ".join(quarter_row[col].split())
+                    for col in range(n_quarters + 1, len(quarter_row))]
+
+    return {"states": state_list, "regions": region_list,
+            "quarters": label_list,
+            "values": values.reshape(len(state_list), n_quarters),
+            "extra": extra.reshape(len(state_list), n_cols - n_quarters),
+            "extra_labels": extra_labels}
+
+
+def read_income_series(fp):
+    '''Read every quarter, percent change and rank from the income file'''
+
+    series = read_series_file(fp)
+
+    # Percent change columns are labeled YYYY:Qn, the last column is rank
+    pct_cols = [i for i, label in enumerate(series["extra_labels"])
+                if re.fullmatch(r"\d{4}:Q[1-4]", label)]
+    series["pct_quarters"] = [series["extra_labels"][i] for i in pct_cols]
+    series["pct_change"] = series["extra"][:, pct_cols]
+    series["rank"] = series["extra"][:, -1]
+
+    return series
+
+
+def read_gdp_series(fp):
+    '''Read every quarter and percent of the U.S. from the GDP file'''
+
+    series = read_series_file(fp)
+
+    # Percent of the U.S. repeats the level quarters
+    series["share"] = series["extra"][:, :len(series["quarters"])]
+
+    return series
+
+
+def series_growth(series, annualize=False):
+    '''Quarter-over-quarter percent change for every state at once'''
+
+    ratio = series["values"][:, 1:]/series["values"][:, :-1]
+    if annualize:
+        ratio = ratio**4
+
+    return (ratio - 1)*100
+
+
+def per_capita_series(series, state_table):
+    '''Dollars per person for every state and quarter'''
 
-    min_income_state = income_list[-1][0], income_list[-1][-1],\
-        income_list[-1][-2]
+    # Population (millions) lined up with the series' states
+    row_dict = {name: row for row, name in enumerate(state_table["name"])}
+    pop = np.array([state_table["pop"][row_dict[name]]
+                    if name in row_dict else np.nan
+                    for name in series["states"]])
 
-    # Sort list by GDP, select first and last values with itemgetter
-    gdp_list = sorted(region_list, key=itemgetter(-2), reverse=True)
-    if gdp_list[0][0] == "DC":
-        max_gdp_state = "District of Columbia", income_list[0][-1],\
-            income_list[0][-2]
+    # Millions of dollars over millions of people
+    return series["values"]/pop[:, None]
+
+
+def region_rollup(series):
+    '''Sum state series into one row per region'''
+
+    region_names, codes = np.unique(series["regions"], return_inverse=True)
+    totals = np.zeros((len(region_names), series["values"].shape[1]),
+                      dtype=series["values"].dtype)
+    np.add.at(totals, codes, series["values"])
+
+    return region_names.tolist(), totals
+
+
+def build_state_table(master_dict):
+    '''Build named columns and a region index from the state dictionary'''
+
+    # Only states with region, income, GDP and population
+    name_list = [state for state, value in master_dict.items()
+                 if len(value) >= 4]
+
+    # Display names come from the shared state IDs, ‘DC’ for ‘District
+    # of Columbia’
+    id_list = stateIds.state_ids(name_list).tolist()
+    display_list = [state if sid < 0 else stateIds.display_name(sid)
+                    for state, sid in zip(name_list, id_list)]
+
+    # Rows in alphabetical order of display name
+    order = sorted(range(len(name_list)), key=lambda i: display_list[i])
+    name_list = [name_list[i] for i in order]
+    display_list = [display_list[i] for i in order]
+    id_list = [id_list[i] for i in order]
+    value_list = [master_dict[state] for state in name_list]
+
+    # Columns, per capita values rounded to nearest dollar once
+    state_table = {
+        "name": name_list,
+        "display": display_list,
+        "state_id": np.array(id_list, dtype=np.int64),
+        "region": [v[0] for v in value_list],
+        "income": np.array([v[1] for v in value_list], dtype=np.int64),
+        "gdp": np.array([v[2] for v in value_list], dtype=np.int64),
+        "pop": np.array([v[3] for v in value_list], dtype=float)}
+    per_capita_columns(state_table)
+
+    # Region name -> alphabetical row indexes, "all" holds every row
+    region_index = {"all": np.arange(len(name_list))}
+    for row, region in enumerate(state_table["region"]):
+        region_index.setdefault(region, []).append(row)
+    state_table["region_index"] = {
+        region: np.array(rows, dtype=np.int64)
+        for region, rows in region_index.items()}
+
+    return state_table
+
+
+def per_capita_columns(state_table):
+    '''Recompute income and GDP per capita from the table's columns'''
+
+    # Per capita values rounded to nearest dollar once
+    with np.errstate(divide="ignore", invalid="ignore"):
+        state_table["income_pc"] = np.round(
+            state_table["income"]/state_table["pop"]).astype(np.int64)
+        state_table["gdp_pc"] = np.round(
+            state_table["gdp"]/state_table["pop"]).astype(np.int64)
+
+
+def update_state_columns(state_table, kind, source_dict):
+    '''Replace one source's columns in place, None if rows must be rebuilt'''
+
+    # Every row needs a new value, a dropped state changes the rows
+    name_list = state_table["name"]
+    if any(state not in source_dict for state in name_list):
+        return None
+
+    if kind == "income":
+        # Income rows also carry the region, moving a state is a rebuild
+        value_list = [source_dict[state] for state in name_list]
+        if [v[0] for v in value_list] != state_table["region"]:
+            return None
+        state_table["income"] = np.array([v[1] for v in value_list],
+                                         dtype=np.int64)
+        column_list = ["income", "income_pc"]
+    elif kind == "gdp":
+        state_table["gdp"] = np.array([source_dict[state]
+                                       for state in name_list],
+                                      dtype=np.int64)
+        column_list = ["gdp", "gdp_pc"]
     else:
-        max_gdp_state = gdp_list[0][0], gdp_list[0][-1], gdp_list[0][-2]
+        state_table["pop"] = np.array([source_dict[state]
+                                       for state in name_list], dtype=float)
+        column_list = ["pop", "income_pc", "gdp_pc"]
+
+    # Per capita columns and region summaries depend on all three
+    per_capita_columns(state_table)
+    invalidate_summaries(state_table)
+
+    return column_list
+
+
+def load_state_table(directory="."):
+    '''Read the three files from a directory into a cached state table'''
+
+    # Parsed table is cached on disk until one of the files changes
+    file_list = [os.path.join(directory, f)
+                 for f in ["income.csv", "gdp.csv", "pop.csv"]]
+
+    def build():
+        master_dict, missing = read_sources(*file_list)
+        state_table = build_state_table(master_dict)
+        state_table["missing"] = missing
+        return state_table
+
+    return dataCache.load_cached("regionGrapher.state_table", file_list,
+                                 build)
 
-    min_gdp_state = gdp_list[-1][0], gdp_list[-1][-1], gdp_list[-1][-2]
+
+def region_rows(state_table, region):
+    '''Find the table rows of a region, None if the region is invalid'''
+
+    # Check if valid region
+    if region not in REGION_SET:
+        return None
+
+    return state_table["region_index"].get(
+        region, np.zeros(0, dtype=np.int64))
+
+
+def get_min_max(state_table, region):
+    '''Extract data for the specified region (str) from the state table'''
+
+    # Region rows, alphabetical
+    rows = region_rows(state_table, region)
+    # If it returns none the region was invalid
+    if rows is None or len(rows) == 0:
+        return None
+
+    income_pc = state_table["income_pc"][rows]
+    gdp_pc = state_table["gdp_pc"][rows]
+
+    # State tuple for a row, switches DC to full name for display
+    def state_tuple(i):
+        row = rows[i]
+        return state_table["name"][row], int(state_table["income_pc"][row]),\
+            int(state_table["gdp_pc"][row])
+
+    # Max keeps the first state alphabetically on ties, min the last
+    max_income_state = state_tuple(np.argmax(income_pc))
+    max_gdp_state = state_tuple(np.argmax(gdp_pc))
+    min_income_state = state_tuple(len(rows) - 1 - np.argmin(income_pc[::-1]))
+    min_gdp_state = state_tuple(len(rows) - 1 - np.argmin(gdp_pc[::-1]))
 
     # Return min and max for income per capita, GDP per capita,
     # States are tuples: (state, income per capita, GDP per capita)
     return min_income_state, max_income_state, min_gdp_state, max_gdp_state
 
 
-def get_region_states(master_dict, region):
+def get_region_states(state_table, region):
     '''Build list of tuples for state data in the specified region'''
 
-    # Check if valid region
-    if region not in REGION_LIST:
+    # Region rows, already alphabetical by state
+    rows = region_rows(state_table, region)
+    if rows is None:
         return None
 
-    # Loop variables
-    region_list = []
-    # List of names to apply to state tuple using count variable for order
-    state_name_list = list(master_dict.keys())
-    count = -1
-
-    # Make list of states in region, add per capita income and GDP
-    for state in master_dict.values():
-        count += 1
-        # Check if state is in region
-        if state[0] != region and region != "all":
-            continue
+    # Tuples: (state, population, GDP, income,
+    # GDP per capita, income per capita)
+    display_list = state_table["display"]
+    return list(zip([display_list[row] for row in rows.tolist()],
+                    state_table["pop"][rows].tolist(),
+                    state_table["gdp"][rows].tolist(),
+                    state_table["income"][rows].tolist(),
+                    state_table["gdp_pc"][rows].tolist(),
+                    state_table["income_pc"][rows].tolist()))
 
-        # Per capita values rounded to nearest dollar
-        income_per_capita = round(state[1]/state[3])
-        GDP_per_capita = round(state[2]/state[3])
 
-        # Tuples: (state, population, GDP, income,
-        # GDP per capita, income per capita)
-        state_tup = state_name_list[count], state[3], state[2], state[1],\
-            GDP_per_capita, income_per_capita
+def region_summary(state_table, region):
+    '''Region's state list and min/max income and GDP, computed once'''
 
-        # Replace ‘District of Columbia’ with ‘DC’ state name for large display
-        if state_name_list[count] == "District of Columbia":
-            state_tup = "DC", state[3], state[2], state[1], \
-                GDP_per_capita, income_per_capita
+    # Summaries live on the table, so a reloaded table starts empty
+    cache = state_table.setdefault("summary_cache", {})
+    if region not in cache:
+        cache[region] = {"states": get_region_states(state_table, region),
+                         "min_max": get_min_max(state_table, region)}
 
-        region_list.append(state_tup)
+    return cache[region]
 
-    # Alphabetize by state
-    region_list = sorted(region_list)
-    # Return sorted list of tuples
-    return region_list
 
+def invalidate_summaries(state_table):
+    '''Drop cached region summaries after the table's columns change'''
 
-def display_region(master_dict, region):
-    '''Display min & max income and GDP; regions’ state data'''
+    state_table["summary_cache"] = {}
+
+
+def format_region(state_table, region):
+    '''Build the display_region text for a region, None if invalid'''
 
     # If region not in region list, return None, display nothing
-    if region not in REGION_LIST:
+    if region not in REGION_SET:
         return None
 
     # Header for all states
     elif region == "all":
-        print("\nData for the all regions:")
+        line_list = ["\nData for the all regions:"]
 
     # Region Header
     else:
-        print("\nData for the {:s} region:".format(region))
+        line_list = ["\nData for the {:s} region:".format(region)]
 
-    # Call get_min_max, get min & max of income and GDP in region
+    # Cached summary holds min & max of income and GDP in region
+    summary = region_summary(state_table, region)
     min_income_state, max_income_state, min_gdp_state, max_gdp_state = \
-        get_min_max(master_dict, region)
+        summary["min_max"]
 
     # Display that data
-    print("\n{:s} has the highest GDP per capita at ${:,d} ".format(
+    line_list.append("\n{:s} has the highest GDP per capita at ${:,d} ".format(
         max_gdp_state[0], max_gdp_state[2]))
-    print("{:s} has the lowest GDP per capita at ${:,d} ".format
-          (min_gdp_state[0], min_gdp_state[2]))
-    print("\n{:s} has the highest Income per capita at ${:,d} ".format(
-        max_income_state[0], max_income_state[1]))
-    print("{:s} has the lowest Income per capita at ${:,d} ".format(
+    line_list.append("{:s} has the lowest GDP per capita at ${:,d} ".format
+                     (min_gdp_state[0], min_gdp_state[2]))
+    line_list.append("\n{:s} has the highest Income per capita at ${:,d} "
+                     .format(max_income_state[0], max_income_state[1]))
+    line_list.append("{:s} has the lowest Income per capita at ${:,d} ".format(
         min_income_state[0], min_income_state[1]))
 
-    # Call get_region_states to get a list of state data
-    state_list = get_region_states(master_dict, region)
+    # Same summary holds the list of state data
+    state_list = summary["states"]
 
     # Header for printing states
-    print("\nData for all states in the {:s} region:".format(region))
-    print("\n{:15s}{:>13s}{:>10s}{:>12s}{:>18s}{:>20s}".format('State',
-        'Population(m)', 'GDP(m)', 'Income(m)',
+    line_list.append("\nData for all states in the {:s} region:"
+                     .format(region))
+    line_list.append("\n{:15s}{:>13s}{:>10s}{:>12s}{:>18s}{:>20s}".format(
+        'State', 'Population(m)', 'GDP(m)', 'Income(m)',
         'GDP per capita', 'Income per capita'))
 
     # Loop through list to display
     for state in state_list:
-        print("{:15s}{:>13,.2f}{:10,d}{:12,d}{:18,d}{:20,d}".format(state[0],
-            state[1], state[2], state[3], state[4], state[5]))
+        line_list.append("{:15s}{:>13,.2f}{:10,d}{:12,d}{:18,d}{:20,d}"
+                         .format(state[0], state[1], state[2], state[3],
+                                 state[4], state[5]))
+
+    return "\n".join(line_list)
+
+
+def display_region(state_table, region):
+    '''Display min & max income and GDP; regions’ state data'''
+
+    text = format_region(state_table, region)
+    if text is not None:
+        print(text)
+
+
+def metric_matrix(state_table):
+    '''Stack the five plot metrics into a metric x state array'''
+
+    # Same order as VALUES_LIST: Pop, GDP, PI, GDPp, PIp
+    return np.vstack([state_table["pop"], state_table["gdp"],
+                      state_table["income"], state_table["gdp_pc"],
+                      state_table["income_pc"]]).astype(float)
+
+
+def region_regressions(state_table, n_outliers=3):
+    '''Correlation and y-on-x fits for every metric pair and region'''
+
+    X = metric_matrix(state_table)
+    region_list = [r for r in REGION_LIST if r in state_table["region_index"]]
+
+    # Region membership as a region x state 0/1 matrix, "all" included
+    member = np.zeros((len(region_list), X.shape[1]))
+    for k, region in enumerate(region_list):
+        member[k, state_table["region_index"][region]] = 1
+
+    # Per-region sums of each metric and each metric pair in one pass
+    count = member.sum(axis=1)
+    mean = member @ X.T/count[:, None]
+    cross = np.einsum("rn,in,jn->rij", member, X, X)/count[:, None, None]
+    cov = cross - mean[:, :, None]*mean[:, None, :]
+    var = np.diagonal(cov, axis1=1, axis2=2)
+
+    # slope[r, i, j] fits metric j (y) on metric i (x) in region r
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov/np.sqrt(var[:, :, None]*var[:, None, :])
+        slope = cov/var[:, :, None]
+    intercept = mean[:, None, :] - slope*mean[:, :, None]
+
+    result_dict = {}
+    for k, region in enumerate(region_list):
+        rows = state_table["region_index"][region]
+        Xr = X[:, rows]
+
+        # residuals[i, j, n] = y_j - (slope*x_i + intercept) for state n
+        residuals = Xr[None, :, :] - (slope[k][:, :, None]*Xr[:, None, :] +
+                                      intercept[k][:, :, None])
+
+        # States with the largest absolute residual for every pair
+        worst = np.argsort(-np.abs(residuals), axis=2)[:, :, :n_outliers]
+        names = np.array([state_table["display"][row] for row in rows],
+                         dtype=object)
+
+        result_dict[region] = {"states": names.tolist(),
+                               "corr": corr[k], "slope": slope[k],
+                               "intercept": intercept[k],
+                               "residuals": residuals,
+                               "outliers": names[worst]}
+
+    # Return dictionary with key=region, arrays indexed [x, y]
+    return result_dict
 
 
 def plot_regression(x, y):
@@ -320,7 +730,8 @@ def plot_regression(x, y):
     pylab.plot(xarr, m*xarr+b, '-')
 
 
-def plot(region_states):
+def plot(region_states, x_name=None, y_name=None, file_str="plot.png",
+         show=True):
     '''
     This function plots the data (GDP, population, Income, GDP per capita, and
     Income per capita) for the selected region. It also plots the regression
@@ -329,26 +740,29 @@ def plot(region_states):
         region_states (list of tuples): list of tuples of data for states
         in the specified region (state, population, GDP,income, GDP per capita,
         and income per capita)
+        x_name, y_name (str): values to plot from VALUES_LIST, prompted for
+        when not given
+        file_str (str): file to save the plot to
+        show (bool): display the plot window after saving
     Returns: None
     '''
 
-    VALUES_LIST = ['Pop', 'GDP', 'PI', 'GDPp', 'PIp']
-    VALUES_NAMES = ['Population(m)', 'GDP(m)', 'Income(m)', 'GDP per capita',
-                    'Income per capita']
     PROMPT2 = "Specify x and y values, space separated from Pop, GDP, PI,\
         GDPp, PIp: "
+    lower_list = [s.lower() for s in VALUES_LIST]
 
     # prompt for which values to plot
-    while True:
+    while x_name is None or y_name is None:
         x_name, y_name = input(PROMPT2).strip().split()
-        if x_name.lower() in [s.lower() for s in VALUES_LIST] \
-                and y_name.lower() in [s.lower() for s in VALUES_LIST]:
+        if x_name.lower() in lower_list and y_name.lower() in lower_list:
             break
         else:
             print("Error in selection. Please try again.")
+            x_name, y_name = None, None
 
-    x_index = VALUES_LIST.index(x_name)
-    y_index = VALUES_LIST.index(y_name)
+    # ValueError for names given by the caller that are not in the list
+    x_index = lower_list.index(x_name.lower())
+    y_index = lower_list.index(y_name.lower())
     # print("indices:",x_name,":",x_index," ; ", y_name, ":",y_index)
 
     # +1 accounts for skipping state name in list
@@ -360,6 +774,18 @@ def plot(region_states):
     x_name = VALUES_NAMES[x_index]
     y_name = VALUES_NAMES[y_index]
 
+    # Headless plots with unchanged inputs reuse the cached render
+    key = plotCache.plot_key(
+        [x, y], [x_name, y_name, state_names],
+        {"kind": "region", "figsize": [6.4, 4.8], "dpi": 100,
+         "matplotlib": matplotlib.__version__}, file_str.rsplit(".", 1)[-1])
+    if not show and plotCache.fetch(key, file_str):
+        return
+
+    # Fresh figure so repeated plots do not draw over each other
+    pylab.rcParams['figure.figsize'] = 6.4, 4.8
+    pylab.figure()
+
     # Set the labels and titles of the plot
     pylab.title(x_name+" vs. "+y_name)
 
@@ -374,25 +800,26 @@ def plot(region_states):
     # plot the regression line between x and y
     plot_regression(x, y)
 
-    # save and show the graph
-    pylab.savefig("plot.png", dpi=100)
-    pylab.show()
+    # save and show the graph, headless callers skip the window
+    pylab.savefig(file_str, dpi=100)
+    plotCache.store(key, file_str)
+    if show:
+        pylab.show()
+    pylab.close()
 
 
 def main():
 
     # Call the open_file() with the appropriate string
     # fp = open_file()
-    # Read to create dictionary, key is state, value is list of region, income
-    master_dict = read_income_file(open("income.csv", "r"))
-
-    # fp = open_file("GDP")
-    # Read file to add GDP to dictionary
-    master_dict = read_gdp_file(open("gdp.csv", "r"), master_dict)
+    # Read income, GDP and population files into a table of state columns
+    state_table = load_state_table()
 
-    # fp = open_file("population")
-    # Read file to add population to dictionary
-    master_dict = read_pop_file(open("pop.csv", "r"), master_dict)
+    # Warn about states that were dropped because a source lacks them
+    for kind, name_list in state_table["missing"].items():
+        name_list = [name for name in name_list if stateIds.is_state(name)]
+        if len(name_list) > 0:
+            print("Not in the {} file: {}".format(kind, ", ".join(name_list)))
 
     # Loop prompting for a region to display data with an option to plot data
     while True:
@@ -402,17 +829,17 @@ def main():
         # ‘q’ or ‘Q’ to quit looping, string is PROMPT1
         if region.lower() == 'q':
             break
-        elif region not in REGION_LIST:
+        elif region not in REGION_SET:
             continue
 
-        display_region(master_dict, region)
+        display_region(state_table, region)
 
         # Prompt to plot, plot only if 'yes' is entered
         plot_answer_str = input("\nDo you want to create a plot? ")
 
-        # If plotting, call get_region_states to get x and y values to plot
+        # If plotting, reuse the region summary's states for x and y values
         if plot_answer_str.lower() == "yes":
-            state_list = get_region_states(master_dict, region)
+            state_list = region_summary(state_table, region)["states"]
             plot(state_list)
 
 
@@ -0,0 +1,159 @@
+"""
+State Name Resolver
+
+    Normalize():
+        Fold case and whitespace so lookups ignore formatting
+    Build_id_dict():
+        Hash table from every spelling of a state to its ID
+    State_id():
+        Integer state ID for a full name, abbreviation or FIPS code
+    State_ids():
+        State IDs for a list of keys, -1 where a key is unknown
+    Is_state():
+        True for the 50 states and DC, False for territories and unknowns
+    Canonical_name():
+        Full name for any spelling of a state, the key itself if unknown
+    Ids_from_county_fips():
+        State IDs for county FIPS codes, vectorized
+    Name(), Abbreviation(), Display_name(), Fips():
+        Look up one field of a state by ID
+
+IDs follow the 2-letter code order financialSorter has always used, so
+ID i is financialSorter.STATES[i]. Puerto Rico comes last.
+"""
+
+import numpy as np
+
+# Constants, (full name, abbreviation, FIPS) in ID order
+STATE_LIST = [
+    ("Alabama", "AL", 1), ("Alaska", "AK", 2), ("Arizona", "AZ", 4),
+    ("Arkansas", "AR", 5), ("California", "CA", 6), ("Colorado", "CO", 8),
+    ("Connecticut", "CT", 9), ("District of Columbia", "DC", 11),
+    ("Delaware", "DE", 10), ("Florida", "FL", 12), ("Georgia", "GA", 13),
+    ("Hawaii", "HI", 15), ("Idaho", "ID", 16), ("Illinois", "IL", 17),
+    ("Indiana", "IN", 18), ("Iowa", "IA", 19), ("Kansas", "KS", 20),
+    ("Kentucky", "KY", 21), ("Louisiana", "LA", 22), ("Maine", "ME", 23),
+    ("Maryland", "MD", 24), ("Massachusetts", "MA", 25),
+    ("Michigan", "MI", 26), ("Minnesota", "MN", 27),
+    ("Mississippi", "MS", 28), ("Missouri", "MO", 29), ("Montana", "MT", 30),
+    ("Nebraska", "NE", 31), ("Nevada", "NV", 32),
+    ("New Hampshire", "NH", 33), ("New Jersey", "NJ", 34),
+    ("New Mexico", "NM", 35), ("New York", "NY", 36),
+    ("North Carolina", "NC", 37), ("North Dakota", "ND", 38),
+    ("Ohio", "OH", 39), ("Oklahoma", "OK", 40), ("Oregon", "OR", 41),
+    ("Pennsylvania", "PA", 42), ("Rhode Island", "RI", 44),
+    ("South Carolina", "SC", 45), ("South Dakota", "SD", 46),
+    ("Tennessee", "TN", 47), ("Texas", "TX", 48), ("Utah", "UT", 49),
+    ("Vermont", "VT", 50), ("Virginia", "VA", 51), ("Washington", "WA", 53),
+    ("West Virginia", "WV", 54), ("Wisconsin", "WI", 55),
+    ("Wyoming", "WY", 56), ("Puerto Rico", "PR", 72)]
+
+NAMES = [s[0] for s in STATE_LIST]
+ABBREVIATIONS = [s[1] for s in STATE_LIST]
+FIPS_CODES = [s[2] for s in STATE_LIST]
+
+# Long names shortened for table display
+DISPLAY_NAMES = ["DC" if full_name == "District of Columbia" else full_name
+                 for full_name in NAMES]
+
+# The 50 states and DC come first, territories after them
+N_STATES = 51
+
+
+def normalize(key):
+    """Fold case and whitespace so lookups ignore formatting"""
+
+    return " ".join(str(key).split()).lower()
+
+
+def build_id_dict():
+    """Hash table from every spelling of a state to its ID"""
+
+    # Full names, abbreviations and 2-digit FIPS strings, as written and
+    # normalized
+    id_dict = {}
+    for sid, (full_name, abbrev, code) in enumerate(STATE_LIST):
+        for key in (full_name, abbrev):
+            id_dict[key] = sid
+            id_dict[normalize(key)] = sid
+        id_dict["{:02d}".format(code)] = sid
+
+    return id_dict
+
+
+ID_DICT = build_id_dict()
+
+# FIPS state code -> ID, -1 for unused codes
+FIPS_TO_ID = np.full(100, -1, dtype=np.int64)
+FIPS_TO_ID[FIPS_CODES] = np.arange(len(STATE_LIST))
+
+
+def state_id(key):
+    """Integer state ID for a full name, abbreviation or FIPS code"""
+
+    # Integers are FIPS state codes
+    if isinstance(key, (int, np.integer)):
+        return int(FIPS_TO_ID[key]) if 0 <= key < 100 and \
+            FIPS_TO_ID[key] >= 0 else None
+
+    # Exact spellings hit without normalizing
+    sid = ID_DICT.get(key)
+    if sid is None:
+        sid = ID_DICT.get(normalize(key))
+
+    return sid
+
+
+def state_ids(key_list):
+    """State IDs for a list of keys, -1 where a key is unknown"""
+
+    return np.array([-1 if sid is None else sid
+                     for sid in map(state_id, key_list)], dtype=np.int64)
+
+
+def is_state(key):
+    """True for the 50 states and DC, False for territories and unknowns"""
+
+    sid = state_id(key)
+    return sid is not None and sid < N_STATES
+
+
+def canonical_name(key):
+    """Full name for any spelling of a state, the key itself if unknown"""
+
+    sid = state_id(key)
+    return key if sid is None else NAMES[sid]
+
+
+def ids_from_county_fips(county_fips):
+    """State IDs for county FIPS codes, vectorized"""
+
+    # County FIPS is the state code followed by three county digits
+    state_fips = np.asarray(county_fips, dtype=np.int64)//1000
+    inside = (state_fips >= 0) & (state_fips < 100)
+
+    return np.where(inside, FIPS_TO_ID[np.clip(state_fips, 0, 99)], -1)
+
+
+def name(sid):
+    """Full name of a state ID"""
+
+    return NAMES[sid]
+
+
+def abbreviation(sid):
+    """2-letter code of a state ID"""
+
+    return ABBREVIATIONS[sid]
+
+
+def display_name(sid):
+    """Name of a state ID as shown in tables"""
+
+    return DISPLAY_NAMES[sid]
+
+
+def fips(sid):
+    """FIPS state code of a state ID"""
+
+    return FIPS_CODES[sid]